@@ -1,19 +1,64 @@
 from flask import Flask
 from config import Config
 from models import db
-from controllers import user_blueprint, product_blueprint, order_blueprint
+from controllers import user_blueprint, product_blueprint, order_blueprint, batch_blueprint, changes_blueprint, jwks_blueprint
+from services.compression import init_compression
+from services.search import init_search
+from services.suggest import init_suggest
+from services.rollups import init_rollups, rollups_cli
+from services.partitions import init_partitions, orders_cli
+from services.outbox import init_outbox, outbox_cli
+from services.changes import init_changes
+from services.cache_bus import cache_bus
+from services.catalog_store import catalog_store, catalog_cli
+from services.product_cache import product_cache
+from services.product_import import init_product_import
+from services.accounts import init_accounts
+from services.provisioning import users_cli
+from services.rate_limit import login_limiter
+from services.passwords import init_passwords
+from services.email_filter import registered_emails
+from services.auth import init_tokens, init_auth
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 db.init_app(app)
+init_tokens(app)
 
 with app.app_context():
     db.create_all()
+    init_product_import()
+    init_accounts()
+    init_search()
+    init_partitions(app)
+    init_rollups(app)
+    init_suggest(app)
 
 app.register_blueprint(user_blueprint, url_prefix='/users')
 app.register_blueprint(product_blueprint, url_prefix='/products')
 app.register_blueprint(order_blueprint, url_prefix='/orders')
+app.register_blueprint(batch_blueprint, url_prefix='/batch')
+app.register_blueprint(changes_blueprint, url_prefix='/changes')
+app.register_blueprint(jwks_blueprint, url_prefix='/.well-known')
+
+init_auth(app, protected=[order_blueprint, changes_blueprint])
+
+init_compression(app)
+init_changes(app)
+init_outbox(app)
+cache_bus.init_app(app)
+catalog_store.init_app(app)
+product_cache.init_app(app)
+login_limiter.init_app(app)
+init_passwords(app)
+registered_emails.init_app(app)
+
+app.cli.add_command(rollups_cli)
+app.cli.add_command(orders_cli)
+app.cli.add_command(outbox_cli)
+app.cli.add_command(catalog_cli)
+app.cli.add_command(users_cli)
 
 
 if __name__ == '__main__':
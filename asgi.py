@@ -0,0 +1,63 @@
+# ASGI entry point: serves the hot read/login paths natively on the event loop
+# and hands every other route to the Flask WSGI app.
+#
+#   uvicorn asgi:application --workers 4
+#
+# Requires the optional async dependencies: asgiref, asyncpg (or aiosqlite) and uvicorn.
+import json
+from asgiref.wsgi import WsgiToAsgi
+from app import app
+from controllers.async_api import AsyncRequest, async_routes
+from services.async_db import init_async_db, dispose_async_db
+from services.compression import compress_body
+
+wsgi_application = WsgiToAsgi(app)
+
+
+async def _read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            init_async_db(app)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await dispose_async_db(app)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    handler = async_routes.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if handler is None:
+        return await wsgi_application(scope, receive, send)
+
+    request = AsyncRequest(scope, await _read_body(receive))
+    body, status, *extra = await handler(app, request)
+    headers = {'Content-Type': 'application/json', **(extra[0] if extra else {})}
+    if isinstance(body, bytes):
+        payload = body
+    else:
+        with app.app_context():
+            payload, encoding_headers = compress_body(json.dumps(body).encode('utf-8'), status,
+                                                      'application/json', request.accept_encodings)
+        headers.update(encoding_headers)
+    headers['Content-Length'] = str(len(payload))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': payload})
@@ -0,0 +1,137 @@
+# Keep-alive HTTP load generator for comparing serving modes side by side.
+#
+# Start each server yourself, then point the benchmark at them, e.g.:
+#
+#   gunicorn -w 4 --threads 8 -b :8001 app:app
+#   uvicorn asgi:application --workers 4 --port 8002
+#   python benchmarks/load.py --path /products/ --concurrency 500 \
+#       --target sync=http://127.0.0.1:8001 --target async=http://127.0.0.1:8002
+#
+# Memory is reported as the summed RSS of the server processes whose command
+# line matches the target's port, sampled at the end of the run.
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def _request(reader, writer, host, method, path, headers, body):
+    head = f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\nContent-Length: {len(body)}\r\n'
+    head += ''.join(f'{k}: {v}\r\n' for k, v in headers.items())
+    writer.write(head.encode('latin-1') + b'\r\n' + body)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed by server')
+    length, chunked, close = 0, False, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+        elif name.lower() == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+        elif name.lower() == 'connection' and 'close' in value.lower():
+            close = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(length)
+    return int(status_line.split()[1]), close
+
+
+async def _client(url, args, deadline, latencies, errors):
+    parts = urlsplit(url)
+    headers = dict(h.split(':', 1) for h in args.header)
+    body = args.data.encode('utf-8')
+    if body:
+        headers.setdefault('Content-Type', 'application/json')
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            start = time.perf_counter()
+            status, close = await _request(reader, writer, parts.netloc, args.method, args.path, headers, body)
+            latencies.append(time.perf_counter() - start)
+            if status >= 500:
+                errors.append(status)
+            if close:
+                writer.close()
+                reader = writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.01)
+    if writer is not None:
+        writer.close()
+
+
+def _rss_mb(port):
+    total = 0
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                cmdline = f.read().replace(b'\0', b' ').decode('utf-8', 'replace')
+            if f':{port}' not in cmdline and f'--port {port}' not in cmdline:
+                continue
+            with open(f'/proc/{pid}/status') as f:
+                total += next(int(l.split()[1]) for l in f if l.startswith('VmRSS:'))
+        except (OSError, StopIteration):
+            continue
+    return total / 1024 if total else None
+
+
+async def run_target(name, url, args):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(url, args, deadline, latencies, errors) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    rss = _rss_mb(urlsplit(url).port)
+    return {
+        'target': name,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else float('nan'),
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else float('nan'),
+        'errors': len(errors),
+        'rss_mb': rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep-alive HTTP load generator')
+    parser.add_argument('--target', action='append', required=True, help='name=url, may be repeated')
+    parser.add_argument('--path', default='/products/')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--data', default='', help='request body, e.g. a login JSON document')
+    parser.add_argument('--header', action='append', default=[], help='"Name: value", may be repeated')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=15.0)
+    args = parser.parse_args()
+
+    print(f"{'target':<12}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'RSS MB':>10}")
+    for target in args.target:
+        name, _, url = target.partition('=')
+        result = asyncio.run(run_target(name, url, args))
+        rss = f"{result['rss_mb']:.1f}" if result['rss_mb'] else 'n/a'
+        print(f"{result['target']:<12}{result['requests']:>10}{result['rps']:>10.1f}{result['p50_ms']:>10.2f}"
+              f"{result['p99_ms']:>10.2f}{result['errors']:>8}{rss:>10}")
+
+
+if __name__ == '__main__':
+    main()
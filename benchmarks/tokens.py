@@ -0,0 +1,74 @@
+# Microbenchmark of the per-login token signing cost: the old path (two
+# jwt.encode calls, each reading SECRET_KEY from the app config) against
+# TokenService.issue, plus verification for each. With cryptography
+# installed, the EdDSA and ES256 modes are measured too.
+#
+#   python benchmarks/tokens.py --number 20000
+import argparse
+import os
+import sys
+import time
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+from flask import Flask, current_app
+from services.auth import EcP256Key, Ed25519Key, HmacKey, TokenService, serialization
+
+
+def legacy_issue(user_id):
+    access = jwt.encode({'user_id': user_id, 'exp': datetime.utcnow() + timedelta(minutes=15)},
+                        current_app.config['SECRET_KEY'], algorithm='HS256')
+    refresh = jwt.encode({'user_id': user_id, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                         current_app.config['SECRET_KEY'], algorithm='HS256')
+    return access, refresh
+
+
+def legacy_verify(token):
+    return jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])['user_id']
+
+
+def _report(name, seconds, number):
+    print(f'{name:<28} {seconds / number * 1e6:8.2f} us/op  {number / seconds:10.0f} ops/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Token signing microbenchmark')
+    parser.add_argument('--number', type=int, default=20000, help='operations per measurement')
+    parser.add_argument('--repeat', type=int, default=5, help='measurements; the best is reported')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'benchmark-secret'
+    service = TokenService([HmacKey('default', app.config['SECRET_KEY'])], 'default', 15 * 60, 60 * 60)
+
+    with app.app_context():
+        access, _ = legacy_issue(1)
+        issued, _ = service.issue(1)
+        cases = [
+            ('issue pair (jwt.encode x2)', lambda: legacy_issue(1)),
+            ('issue pair (TokenService)', lambda: service.issue(1)),
+            ('verify (jwt.decode)', lambda: legacy_verify(access)),
+            ('verify (TokenService)', lambda: service.verify(issued)),
+        ]
+        if serialization is not None:
+            from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+            for key in (Ed25519Key('ed', ed25519.Ed25519PrivateKey.generate()),
+                        EcP256Key('ec', ec.generate_private_key(ec.SECP256R1()))):
+                signer = TokenService([key], key.kid, 15 * 60, 60 * 60)
+                token, _ = signer.issue(1)
+                cases += [
+                    (f'issue pair ({key.algorithm})', lambda signer=signer: signer.issue(1)),
+                    (f'verify ({key.algorithm})', lambda signer=signer, token=token: signer.verify(token)),
+                ]
+        started = time.perf_counter()
+        for name, func in cases:
+            best = min(timeit.repeat(func, number=args.number, repeat=args.repeat))
+            _report(name, best, args.number)
+        print(f'({time.perf_counter() - started:.1f}s total)')
+
+
+if __name__ == '__main__':
+    main()
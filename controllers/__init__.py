@@ -1,3 +1,6 @@
 from .user import user_blueprint
 from .product import product_blueprint
-from .order import order_blueprint
\ No newline at end of file
+from .order import order_blueprint
+from .batch import batch_blueprint
+from .changes import changes_blueprint
+from .jwks import jwks_blueprint
\ No newline at end of file
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import math
+from urllib.parse import parse_qs
+from sqlalchemy import select
+from werkzeug.http import parse_accept_header
+from models.order import Order
+from models.product import Product
+from models.user import User
+from services.async_db import async_session
+from services.auth import issue_tokens, parse_bearer, verify_token
+from services.fieldsets import parse_fields, columns, serialize_rows
+from services.passwords import check_password, dummy_check, needs_rehash
+from services.accounts import email_is, schedule_rehash
+from services.email_filter import registered_emails
+from services.rate_limit import login_limiter, normalize_email
+from services.product_cache import product_cache, parse_ids, FIELDS as CACHED_FIELDS
+from services.catalog_store import catalog_store
+from services.compression import choose_variant
+from controllers.product import PRODUCT_FIELDS
+from controllers.order import ORDER_FIELDS
+
+
+class AsyncRequest:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = {k: v[0] for k, v in parse_qs(scope['query_string'].decode('latin-1')).items()}
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        self.remote_addr = scope['client'][0] if scope.get('client') else None
+        self.accept_encodings = parse_accept_header(self.headers.get('accept-encoding'))
+        self.body = body
+
+    def get_json(self):
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+
+async def _current_user(app, request, session):
+    header = request.headers.get('authorization')
+    if not header:
+        return None, ({'message': 'Token is missing!'}, 401)
+
+    token = parse_bearer(header)
+    if token is None:
+        return None, ({'message': 'Malformed Authorization header. Expected "Bearer <token>".'}, 401)
+
+    with app.app_context():
+        user_id = verify_token(token)
+    if not user_id:
+        return None, ({'message': 'Token is invalid or expired!'}, 401)
+
+    current_user = await session.get(User, user_id)
+    if not current_user:
+        return None, ({'message': 'User not found!'}, 404)
+    return current_user, None
+
+
+async def _products_by_id(app, ids, fields):
+    snapshot = catalog_store.snapshot()
+    if snapshot is not None:
+        return [row for row in (snapshot.get(product_id, fields) for product_id in ids) if row is not None]
+    found, missing = product_cache.lookup(ids)
+    if missing:
+        generation = product_cache.generation
+        async with async_session(app) as session:
+            rows = (await session.execute(
+                select(*columns(Product, CACHED_FIELDS)).where(Product.id.in_(missing))
+            )).all()
+        loaded = serialize_rows(rows, CACHED_FIELDS)
+        product_cache.store(loaded, generation)
+        found.update((entry['id'], entry) for entry in loaded)
+    return [{field: found[i][field] for field in fields} for i in ids if i in found]
+
+
+async def get_products(app, request):
+    try:
+        fields = parse_fields(request.args.get('fields'), PRODUCT_FIELDS)
+        if 'ids' in request.args:
+            ids = parse_ids(request.args['ids'], app.config['PRODUCT_IDS_MAX'])
+            return await _products_by_id(app, ids, fields), 200
+
+        snapshot = catalog_store.snapshot()
+        if snapshot is not None:
+            if 'fields' not in request.args:
+                with app.app_context():
+                    body, encoding = choose_variant(snapshot.variants(), request.accept_encodings)
+                headers = {'Vary': 'Accept-Encoding'}
+                if encoding:
+                    headers['Content-Encoding'] = encoding
+                return body, 200, headers
+            return snapshot.rows(fields), 200
+
+        async with async_session(app) as session:
+            products = (await session.execute(select(*columns(Product, fields)))).all()
+        return serialize_rows(products, fields), 200
+    except ValueError as e:
+        return {'message': str(e)}, 400
+    except Exception as e:
+        return {'message': str(e)}, 500
+
+
+async def get_orders(app, request):
+    try:
+        fields = parse_fields(request.args.get('fields'), ORDER_FIELDS)
+        async with async_session(app) as session:
+            current_user, error = await _current_user(app, request, session)
+            if error:
+                return error
+            orders = (await session.execute(
+                select(*columns(Order, fields)).where(Order.user_id == current_user.id)
+            )).all()
+        return serialize_rows(orders, fields), 200
+    except ValueError as e:
+        return {'message': str(e)}, 400
+    except Exception as e:
+        return {'message': str(e)}, 500
+
+
+async def login(app, request):
+    try:
+        data = request.get_json()
+        if not data or not {'email', 'password'}.issubset(data):
+            return {'message': 'Missing email or password'}, 400
+
+        retry_after = login_limiter.check(request.remote_addr, normalize_email(data['email']))
+        if retry_after:
+            return {'message': 'Too many login attempts. Please try again later.',
+                    'retry_after': math.ceil(retry_after)}, 429, {'Retry-After': str(math.ceil(retry_after))}
+
+        user = None
+        if registered_emails.might_exist(data['email']):
+            async with async_session(app) as session:
+                user = (await session.execute(select(User).where(email_is(data['email'])))).scalars().first()
+
+        # bcrypt is CPU-bound and releases the GIL, so it runs off the event loop.
+        if user and await asyncio.to_thread(check_password, user.password, data['password']):
+            if needs_rehash(user.password):
+                schedule_rehash(app, user, data['password'])
+            with app.app_context():
+                access_token, refresh_token = issue_tokens(user)
+            return {'message': 'Login successful', 'access_token': access_token, 'refresh_token': refresh_token, 'user': {
+                'id': user.id,
+                'username': user.username,
+                'email': user.email,
+                'date_created': user.date_created.isoformat()
+            }}, 200
+        else:
+            if user is None:
+                await asyncio.to_thread(dummy_check, data['password'])
+            return {'message': 'Invalid email or password'}, 401
+
+    except Exception as e:
+        return {'message': str(e)}, 500
+
+
+# (method, path) -> handler; every other route falls through to the WSGI app.
+# Handlers return (body, status) or (body, status, headers). A dict or list
+# body is sent as JSON, compressed as the WSGI app would; a bytes body is
+# sent as is, already encoded per the headers.
+async_routes = {
+    ('GET', '/products/'): get_products,
+    ('GET', '/orders/'): get_orders,
+    ('POST', '/users/login'): login,
+}
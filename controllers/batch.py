@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from flask import Blueprint, request, jsonify, current_app, g
+from werkzeug.test import EnvironBuilder
+from models import db
+from services.auth import authenticate_request
+
+batch_blueprint = Blueprint('batch_blueprint', __name__)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['BATCH_MAX_WORKERS'], thread_name_prefix='batch')
+        return _executor
+
+
+def _forwarded():
+    # EnvironBuilder arguments every sub-request inherits from the batch. The
+    # client address keeps per-IP limits (e.g. on login) applying inside a batch.
+    headers = {}
+    if 'Authorization' in request.headers:
+        headers['Authorization'] = request.headers['Authorization']
+    return {'headers': headers, 'base_url': request.host_url,
+            'environ_base': {'REMOTE_ADDR': request.remote_addr}}
+
+
+def _dispatch(app, sub_request, forwarded):
+    builder = EnvironBuilder(
+        path=sub_request['path'],
+        method=sub_request['method'],
+        json=sub_request.get('body'),
+        **forwarded,
+    )
+    with app.request_context(builder.get_environ()):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            response = jsonify({'message': str(e)})
+            response.status_code = 500
+        # Sub-requests share the batch's session, and a view that fails
+        # part-way through a write can leave it unusable (or holding
+        # unflushed objects the next commit would write), so it is reset
+        # before the next sub-request runs.
+        if response.status_code >= 500:
+            db.session.rollback()
+
+    body = response.get_json(silent=True)
+    if body is None and response.status_code != 204:
+        body = response.get_data(as_text=True)
+    return {'status': response.status_code, 'body': body}
+
+
+def _dispatch_concurrently(app, sub_requests, forwarded):
+    # Each worker thread gets its own app context (and so its own DB session)
+    # but is seeded with the principal already resolved for this batch.
+    principal = g.get('current_user')
+    token = g.get('auth_token')
+    if principal is not None:
+        principal.id  # reload expired attributes here, not from a worker thread
+
+    def run(sub_request):
+        with app.app_context():
+            if principal is not None:
+                g.current_user = principal
+                g.auth_token = token
+            return _dispatch(app, sub_request, forwarded)
+
+    return list(_get_executor(app).map(run, sub_requests))
+
+
+def _validate(sub_request):
+    if not isinstance(sub_request, dict) or not isinstance(sub_request.get('path'), str):
+        return 'Each request must be an object with a path'
+    if not sub_request['path'].startswith('/') or sub_request['path'].split('?')[0].rstrip('/') == '/batch':
+        return f"Invalid path: {sub_request['path']}"
+    sub_request['method'] = str(sub_request.get('method', 'GET')).upper()
+    return None
+
+
+@batch_blueprint.route('/', methods=['POST'], strict_slashes=False)
+def batch():
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data, list):
+            return jsonify({'message': 'Request body must be a list of requests'}), 400
+        if len(data) > current_app.config['BATCH_MAX_REQUESTS']:
+            return jsonify({'message': f"A batch may contain at most {current_app.config['BATCH_MAX_REQUESTS']} requests"}), 400
+
+        for sub_request in data:
+            error = _validate(sub_request)
+            if error:
+                return jsonify({'message': error}), 400
+
+        # Authenticate once up front; sub-requests reuse the principal from g.
+        # A bad token is reported by each protected sub-request individually.
+        if 'Authorization' in request.headers:
+            try:
+                authenticate_request()
+            except Exception:
+                pass
+
+        app = current_app._get_current_object()
+        forwarded = _forwarded()
+        results = [None] * len(data)
+        reads = []
+
+        def flush_reads():
+            if len(reads) == 1:
+                results[reads[0]] = _dispatch(app, data[reads[0]], forwarded)
+            elif reads:
+                for index, result in zip(reads, _dispatch_concurrently(app, [data[i] for i in reads], forwarded)):
+                    results[index] = result
+            reads.clear()
+
+        # Consecutive GETs run concurrently; writes run in order on this
+        # request's session, after every read submitted before them.
+        for index, sub_request in enumerate(data):
+            if sub_request['method'] == 'GET':
+                reads.append(index)
+                continue
+            flush_reads()
+            results[index] = _dispatch(app, sub_request, forwarded)
+        flush_reads()
+
+        return jsonify(results), 200
+
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
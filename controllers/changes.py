@@ -0,0 +1,72 @@
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import or_
+from models import db
+from models.change_log import ChangeLog
+from models.order import Order
+from models.product import Product
+from services.auth import token_required
+from services.changes import change_notifier
+from services.fieldsets import columns, serialize_rows
+from services.notify import start_listener
+from controllers.product import PRODUCT_FIELDS
+from controllers.order import ORDER_FIELDS
+
+changes_blueprint = Blueprint('changes_blueprint', __name__)
+
+ENTITIES = {
+    'product': (Product, PRODUCT_FIELDS),
+    'order': (Order, ORDER_FIELDS),
+}
+
+
+def _fetch_changes(current_user, since, limit):
+    # Products are public; orders are only visible to their owner.
+    return (ChangeLog.query
+            .filter(ChangeLog.seq > since)
+            .filter(or_(ChangeLog.owner_id.is_(None), ChangeLog.owner_id == current_user.id))
+            .order_by(ChangeLog.seq).limit(limit).all())
+
+
+def _load_entities(changes):
+    # One IN query per entity type for the current state of everything changed.
+    loaded = {}
+    for entity, (model, fields) in ENTITIES.items():
+        ids = {change.entity_id for change in changes if change.entity == entity}
+        if ids:
+            rows = db.session.query(*columns(model, fields)).filter(model.id.in_(ids)).all()
+            loaded.update({(entity, row['id']): row for row in serialize_rows(rows, fields)})
+    return loaded
+
+
+@changes_blueprint.route('/', methods=['GET'], strict_slashes=False)
+@token_required
+def get_changes(current_user):
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = min(request.args.get('limit', current_app.config['CHANGES_PAGE_SIZE'], type=int),
+                    current_app.config['CHANGES_MAX_PAGE_SIZE'])
+        timeout = min(request.args.get('timeout', 0, type=float), current_app.config['CHANGES_MAX_WAIT'])
+        start_listener()
+
+        version = change_notifier.version
+        changes = _fetch_changes(current_user, since, limit)
+        if not changes and timeout > 0:
+            # Hand the connection back to the pool while parked.
+            db.session.rollback()
+            if change_notifier.wait(version, timeout):
+                changes = _fetch_changes(current_user, since, limit)
+
+        entities = _load_entities(changes)
+        return jsonify({
+            'changes': [{
+                'seq': change.seq,
+                'entity': change.entity,
+                'id': change.entity_id,
+                'op': change.op,
+                'data': entities.get((change.entity, change.entity_id))
+            } for change in changes],
+            'cursor': changes[-1].seq if changes else since
+        }), 200
+
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
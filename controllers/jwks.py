@@ -0,0 +1,18 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+from services.auth import token_service
+
+jwks_blueprint = Blueprint('jwks_blueprint', __name__)
+
+@jwks_blueprint.route('/jwks.json', methods=['GET'])
+def get_jwks():
+    # The document is built once when the keys are loaded; gateways and edge
+    # proxies fetch it to verify tokens without calling the API.
+    service = token_service()
+    if service.jwks is None:
+        return jsonify({'message': 'Tokens are signed with a shared secret; no public keys are published'}), 404
+
+    response = Response(service.jwks, mimetype='application/jwk-set+json')
+    response.set_etag(service.jwks_etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['JWKS_MAX_AGE']
+    return response.make_conditional(request)
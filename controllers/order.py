@@ -2,26 +2,37 @@ from flask import Blueprint, request, jsonify
 from models.order import Order
 from models.product import Product
 from models.user import User
+from models.order_rollup import OrderDailyRollup
+from models.order_summary import UserOrderSummary
 from models import db
-from services.auth import token_required
+from services.auth import token_required, admin_required
+from services.fieldsets import requested_fields, columns, serialize_rows
+from services.suggest import suggest_index
+from services.rollups import record_orders, record_user_summary
+from services.outbox import add_order_events
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy import func
+from datetime import date
 
 order_blueprint = Blueprint('order_blueprint', __name__)
 
+ORDER_FIELDS = ('id', 'product_id', 'user_id', 'quantity', 'status', 'date_created')
+
+STATS_GROUPS = {
+    'day': OrderDailyRollup.day,
+    'product': OrderDailyRollup.product_id,
+    'status': OrderDailyRollup.status,
+}
+
 @order_blueprint.route('/', methods=['GET'])
 @token_required
 def get_orders(current_user):
     try:
-        orders = Order.query.filter_by(user_id=current_user.id).all()
-        orders_list = [{
-            'id': order.id,
-            'product_id': order.product_id,
-            'user_id': order.user_id,
-            'quantity': order.quantity,
-            'status': order.status,
-            'date_created': order.date_created.isoformat()
-        } for order in orders]
-        return jsonify(orders_list)
+        fields = requested_fields(ORDER_FIELDS)
+        orders = db.session.query(*columns(Order, fields)).filter(Order.user_id == current_user.id).all()
+        return jsonify(serialize_rows(orders, fields))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -34,6 +45,7 @@ def add_orders(current_user):
             return jsonify({'message': 'Request body must be a list of orders'}), 400
 
         orders = []
+        prices = {}
         for order_data in data:
             if not {'product_id', 'quantity'}.issubset(order_data):
                 return jsonify({'message': 'Missing required fields in one of the orders'}), 400
@@ -41,6 +53,7 @@ def add_orders(current_user):
             product = Product.query.get(order_data['product_id'])
             if not product:
                 return jsonify({'message': f"Product with id {order_data['product_id']} not found"}), 404
+            prices[product.id] = product.price
 
             order = Order(
                 product_id=order_data['product_id'],
@@ -51,7 +64,13 @@ def add_orders(current_user):
             orders.append(order)
 
         db.session.add_all(orders)
+        db.session.flush()
+        record_orders(orders, prices)
+        record_user_summary(current_user.id, orders)
+        add_order_events(orders)
         db.session.commit()
+        for order in orders:
+            suggest_index.bump(order.product_id, order.quantity)
 
         return jsonify({'message': 'Orders placed successfully'}), 201
 
@@ -67,22 +86,71 @@ def add_orders(current_user):
 @token_required
 def get_user_orders(current_user):
     try:
-        orders = Order.query.filter_by(user_id=current_user.id).all()
+        fields = requested_fields(ORDER_FIELDS)
+        orders = db.session.query(*columns(Order, fields)).filter(Order.user_id == current_user.id).all()
         if not orders:
             return jsonify({'message': 'No orders found'}), 404
 
-        orders_list = [{
-            'id': order.id,
-            'product_id': order.product_id,
-            'user_id': order.user_id,
-            'quantity': order.quantity,
-            'status': order.status,
-            'date_created': order.date_created.isoformat()
-        } for order in orders]
+        return jsonify(serialize_rows(orders, fields)), 200
 
-        return jsonify(orders_list), 200
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
 
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
 
+@order_blueprint.route('/summary', methods=['GET'])
+@token_required
+def get_order_summary(current_user):
+    try:
+        summary = db.session.get(UserOrderSummary, current_user.id)
+        return jsonify({
+            'order_count': summary.order_count if summary else 0,
+            'lifetime_units': summary.lifetime_units if summary else 0,
+            'last_order_at': summary.last_order_at.isoformat() if summary and summary.last_order_at else None
+        }), 200
+
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+
+@order_blueprint.route('/stats', methods=['GET'])
+@admin_required
+def get_order_stats(current_user):
+    try:
+        group_by = request.args.get('group_by', 'day').split(',')
+        unknown = [group for group in group_by if group not in STATS_GROUPS]
+        if unknown:
+            return jsonify({'message': f"Unknown group_by: {', '.join(unknown)}. Allowed: {', '.join(STATS_GROUPS)}"}), 400
+        group_columns = [STATS_GROUPS[group] for group in group_by]
+
+        query = db.session.query(
+            *group_columns,
+            func.sum(OrderDailyRollup.order_count),
+            func.sum(OrderDailyRollup.units),
+            func.sum(OrderDailyRollup.revenue),
+        )
+        if request.args.get('from'):
+            query = query.filter(OrderDailyRollup.day >= date.fromisoformat(request.args['from']))
+        if request.args.get('to'):
+            query = query.filter(OrderDailyRollup.day <= date.fromisoformat(request.args['to']))
+        if request.args.get('product_id'):
+            query = query.filter(OrderDailyRollup.product_id == request.args.get('product_id', type=int))
+        if request.args.get('status'):
+            query = query.filter(OrderDailyRollup.status == request.args['status'])
+        rows = query.group_by(*group_columns).order_by(*group_columns).all()
+
+        stats = []
+        for row in rows:
+            entry = {group: (value.isoformat() if group == 'day' else value) for group, value in zip(group_by, row)}
+            order_count, units, revenue = row[len(group_by):]
+            entry.update({'order_count': order_count, 'units': units, 'revenue': revenue})
+            stats.append(entry)
+        return jsonify(stats), 200
+
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
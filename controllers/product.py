@@ -1,25 +1,89 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from sqlalchemy.exc import IntegrityError
 from models.product import Product
 from models import db
+from services.fieldsets import requested_fields, columns, serialize_rows
+from services.search import search_products
+from services.suggest import suggest_index
+from services.cache_bus import cache_bus
+from services.catalog_store import catalog_store
+from services.compression import variant_response
+from services.product_cache import product_cache, parse_ids
+from services.product_import import PARSERS, import_products
+from services.auth import admin_required
 
 product_blueprint = Blueprint('product_blueprint', __name__)
 
+PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'date_added')
+
+def _products_by_id(ids, fields):
+    snapshot = catalog_store.snapshot()
+    if snapshot is not None:
+        return [row for row in (snapshot.get(product_id, fields) for product_id in ids) if row is not None]
+    return product_cache.get_many(ids, fields)
+
 @product_blueprint.route('/', methods=['GET'])
 def get_products():
     try:
-        products = Product.query.all()
-        products_list = [{
-            'id': product.id,
-            'name': product.name,
-            'description': product.description,
-            'price': product.price,
-            'date_added': product.date_added.isoformat()
-        } for product in products]
-        return jsonify(products_list)
+        fields = requested_fields(PRODUCT_FIELDS)
+        if 'ids' in request.args:
+            ids = parse_ids(request.args['ids'], current_app.config['PRODUCT_IDS_MAX'])
+            return jsonify(_products_by_id(ids, fields))
+
+        snapshot = catalog_store.snapshot()
+        if snapshot is not None:
+            if 'fields' not in request.args:
+                return variant_response(snapshot.variants())
+            return jsonify(snapshot.rows(fields))
+
+        products = db.session.query(*columns(Product, fields)).all()
+        return jsonify(serialize_rows(products, fields))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@product_blueprint.route('/<int:product_id>', methods=['GET'])
+def get_product(product_id):
+    try:
+        fields = requested_fields(PRODUCT_FIELDS)
+        products = _products_by_id([product_id], fields)
+        if not products:
+            return jsonify({'message': 'Product not found'}), 404
+        return jsonify(products[0])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@product_blueprint.route('/search', methods=['GET'])
+def search():
+    try:
+        q = request.args.get('q', '').strip()
+        if not q:
+            return jsonify({'message': 'Missing search query'}), 400
+
+        fields = requested_fields(PRODUCT_FIELDS)
+        limit = min(request.args.get('limit', current_app.config['SEARCH_PAGE_SIZE'], type=int),
+                    current_app.config['SEARCH_MAX_PAGE_SIZE'])
+        if limit < 1:
+            return jsonify({'message': 'limit must be positive'}), 400
+
+        products, next_cursor = search_products(q, columns(Product, fields), limit, request.args.get('cursor'))
+        return jsonify({'results': serialize_rows(products, fields), 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': str(e)}), 500
-    
+
+@product_blueprint.route('/suggest', methods=['GET'])
+def suggest():
+    prefix = request.args.get('prefix', '')
+    if not prefix.strip():
+        return jsonify({'message': 'Missing prefix'}), 400
+    k = request.args.get('k', current_app.config['SUGGEST_MAX_K'], type=int)
+    return jsonify(suggest_index.suggest(prefix, k))
+
 @product_blueprint.route('/add', methods=['POST'])
 def add_product():
     try:
@@ -29,7 +93,9 @@ def add_product():
 
         product = Product(name=data['name'], description=data['description'], price=data['price'])
         db.session.add(product)
+        cache_bus.invalidate('products')
         db.session.commit()
+        suggest_index.add(product.id, product.name)
 
         return jsonify({'message': 'Product added successfully'}), 201
 
@@ -38,4 +104,20 @@ def add_product():
         return jsonify({'message': 'Database error occurred. Please try again.'}), 500
 
     except Exception as e:
-        return jsonify({'message': str(e)}), 500
\ No newline at end of file
+        return jsonify({'message': str(e)}), 500
+
+@product_blueprint.route('/import', methods=['POST'])
+@admin_required
+def import_catalog(current_user):
+    parser = PARSERS.get(request.mimetype)
+    if parser is None:
+        return jsonify({'message': f"Unsupported Content-Type. Use one of: {', '.join(PARSERS)}"}), 415
+    try:
+        report = import_products(parser(request.stream), current_app.config['IMPORT_BATCH_SIZE'],
+                                 current_app.config['IMPORT_MAX_ERRORS'])
+        if 'error' in report:
+            return jsonify(dict(report, message=report['error'])), 400
+        return jsonify(report)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 500
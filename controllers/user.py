@@ -1,52 +1,62 @@
-from flask import Blueprint, request, jsonify
+import math
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from sqlalchemy.exc import IntegrityError
-from functools import wraps
 from models import db
 from models.user import User
-from services.auth import generate_access_token, generate_refresh_token, verify_token
-from flask_bcrypt import Bcrypt
+from services.auth import issue_tokens, generate_access_token, verify_token, token_required, admin_required
+from services.fieldsets import requested_fields, columns, serialize_rows
+from services.passwords import hash_password, check_password, dummy_check, needs_rehash
+from services.email_filter import registered_emails
+from services.accounts import create_user, email_is, schedule_rehash
+from services.user_listing import list_users, iter_user_pages
+from services.cache_bus import cache_bus
+from services.provisioning import provision_users
+from services.rate_limit import login_limiter, normalize_email
 
 user_blueprint = Blueprint('user_blueprint', __name__)
-bcrypt = Bcrypt()
-
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-       
-        if 'Authorization' in request.headers:
-            token = request.headers['Authorization'].split(" ")[1]  
-        
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-        
-        try:
-            user_id = verify_token(token)
-            if not user_id:
-                return jsonify({'message': 'Token is invalid or expired!'}), 401
-            current_user = User.query.get(user_id)
-            if not current_user:
-                return jsonify({'message': 'User not found!'}), 404
-        except Exception as e:
-            return jsonify({'message': 'Something went wrong: ' + str(e)}), 500
-        
-        return f(current_user, *args, **kwargs)
-    
-    return decorated
+# Password hashes are never listed.
+USER_FIELDS = ('id', 'username', 'email', 'date_created')
+
+def _datetime_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 date or datetime')
 
 @user_blueprint.route('/', methods=['GET'])
-def get_users():
+@admin_required
+def get_users(current_user):
     try:
-        users = User.query.all()
-        users_list = [ {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'password': user.password,
-                'confirm_password': user.confirm_password,
-                'date_created': user.date_created.isoformat()
-            } for user in users]
-        return jsonify(users_list)
+        fields = requested_fields(USER_FIELDS)
+        filters = {
+            'created_after': _datetime_arg('created_after'),
+            'created_before': _datetime_arg('created_before'),
+            'email_prefix': request.args.get('email_prefix', '').strip() or None,
+        }
+
+        if request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson':
+            pages = iter_user_pages(columns(User, fields), current_app.config['USERS_STREAM_PAGE_SIZE'], **filters)
+            dumps = current_app.json.dumps
+
+            def generate():
+                for rows in pages:
+                    yield ''.join(dumps(row, separators=(',', ':')) + '\n' for row in serialize_rows(rows, fields))
+
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+        limit = min(request.args.get('limit', current_app.config['USERS_PAGE_SIZE'], type=int),
+                    current_app.config['USERS_MAX_PAGE_SIZE'])
+        if limit < 1:
+            return jsonify({'message': 'limit must be positive'}), 400
+
+        users, next_cursor = list_users(columns(User, fields), limit, request.args.get('cursor'), **filters)
+        return jsonify({'results': serialize_rows(users, fields), 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -58,19 +68,18 @@ def register():
         if not data or not {'username', 'email', 'password', 'confirm_password'}.issubset(data):
             return jsonify({'message': 'Missing required fields'}), 400
 
-        existing_user = User.query.filter_by(email=data['email']).first()
-        if existing_user:
-            return jsonify({'message': 'Email already registered. Please try with different email.'}), 400
-
         if data['password'] != data.get('confirm_password'):
             return jsonify({'message': 'Passwords do not match'}), 400
 
-        hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
-        user = User(username=data['username'], email=data['email'], password=hashed_password, confirm_password=hashed_password)
-        db.session.add(user)
+        hashed_password = hash_password(data['password'])
+        user = create_user(data['username'], data['email'], hashed_password)
+        if user is None:
+            db.session.rollback()
+            return jsonify({'message': 'Email already registered. Please try with different email.'}), 400
+        cache_bus.invalidate('users', data=[user.email])
         db.session.commit()
-        access_token = generate_access_token(user)
-        refresh_token = generate_refresh_token(user)
+        registered_emails.add(user.email)
+        access_token, refresh_token = issue_tokens(user)
 
         return jsonify({'message': 'User created successfully', 'access_token': access_token, 'refresh_token': refresh_token}), 201
 
@@ -81,6 +90,24 @@ def register():
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
+@user_blueprint.route('/provision', methods=['POST'])
+@admin_required
+def provision(current_user):
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('users'), list):
+            return jsonify({'message': 'Expected {"users": [...]}'}), 400
+        if len(data['users']) > current_app.config['PROVISION_MAX_USERS']:
+            return jsonify({'message': f"At most {current_app.config['PROVISION_MAX_USERS']} users per request"}), 400
+
+        report = provision_users(data['users'], current_app.config['PROVISION_BATCH_SIZE'],
+                                 current_app.config['PROVISION_WORKERS'])
+        return jsonify(report), 201 if report['created'] else 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 500
+
 @user_blueprint.route('/login', methods=['POST'])
 def login():
     try:
@@ -88,10 +115,23 @@ def login():
         if not data or not {'email', 'password'}.issubset(data):
             return jsonify({'message': 'Missing email or password'}), 400
 
-        user = User.query.filter_by(email=data['email']).first()
-        if user and bcrypt.check_password_hash(user.password, data['password']):
-            access_token = generate_access_token(user)
-            refresh_token = generate_refresh_token(user)
+        # Throttled attempts are turned away before the DB query and bcrypt.
+        retry_after = login_limiter.check(request.remote_addr, normalize_email(data['email']))
+        if retry_after:
+            response = jsonify({'message': 'Too many login attempts. Please try again later.',
+                                'retry_after': math.ceil(retry_after)})
+            response.headers['Retry-After'] = str(math.ceil(retry_after))
+            return response, 429
+
+        # Emails the filter has never seen skip the query, and every miss pays
+        # for a bcrypt check so response times do not reveal which exist.
+        user = None
+        if registered_emails.might_exist(data['email']):
+            user = User.query.filter(email_is(data['email'])).first()
+        if user and check_password(user.password, data['password']):
+            if needs_rehash(user.password):
+                schedule_rehash(current_app._get_current_object(), user, data['password'])
+            access_token, refresh_token = issue_tokens(user)
             return jsonify({'message': 'Login successful', 'access_token': access_token, 'refresh_token': refresh_token,'user': {
                 'id': user.id,
                 'username': user.username,
@@ -99,6 +139,8 @@ def login():
                 'date_created': user.date_created.isoformat()
             }}), 200
         else:
+            if user is None:
+                dummy_check(data['password'])
             return jsonify({'message': 'Invalid email or password'}), 401
 
     except Exception as e:
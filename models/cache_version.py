@@ -0,0 +1,9 @@
+from models import db
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_version'
+    key = db.Column(db.String(200), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.key} {self.version}>'
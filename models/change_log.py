@@ -0,0 +1,15 @@
+from datetime import datetime
+from models import db
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+    # Owning user for per-user entities (orders), so feeds can be scoped.
+    owner_id = db.Column(db.Integer, index=True)
+    date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ChangeLog {self.seq} {self.op} {self.entity} {self.entity_id}>'
@@ -0,0 +1,21 @@
+from models import db
+
+class OrderDailyRollup(db.Model):
+    __tablename__ = 'order_daily_rollup'
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<OrderDailyRollup {self.day} {self.product_id} {self.status}>'
+
+class RollupWatermark(db.Model):
+    __tablename__ = 'rollup_watermark'
+    name = db.Column(db.String(50), primary_key=True)
+    last_order_id = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<RollupWatermark {self.name} {self.last_order_id}>'
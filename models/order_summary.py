@@ -0,0 +1,11 @@
+from models import db
+
+class UserOrderSummary(db.Model):
+    __tablename__ = 'user_order_summary'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    lifetime_units = db.Column(db.Integer, nullable=False, default=0)
+    last_order_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<UserOrderSummary {self.user_id}>'
@@ -0,0 +1,21 @@
+from datetime import datetime
+from models import db
+
+class OutboxEvent(db.Model):
+    __tablename__ = 'outbox_event'
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    aggregate_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.event_type}>'
+
+class OutboxCheckpoint(db.Model):
+    __tablename__ = 'outbox_checkpoint'
+    consumer = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<OutboxCheckpoint {self.consumer} {self.last_event_id}>'
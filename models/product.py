@@ -3,6 +3,7 @@ from models import db
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    sku = db.Column(db.String(64), unique=True)
     name = db.Column(db.String(120), nullable=False)
     description = db.Column(db.Text, nullable=False)
     price = db.Column(db.Float, nullable=False)
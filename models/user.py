@@ -6,8 +6,14 @@ class User(db.Model):
     username = db.Column(db.String(80), nullable=False)
     email = db.Column(db.String(120), nullable=False, unique=True)
     password = db.Column(db.String(120), nullable=False)
-    confirm_password = db.Column(db.String(120), nullable=False)
+    # No longer written; kept so existing rows and queries still load.
+    confirm_password = db.Column(db.String(120))
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_user_email_lower', db.func.lower(email), unique=True),
+        db.Index('ix_user_date_created_id', date_created, id),
+    )
+
     def __repr__(self):
         return f'<User {self.username}>'
@@ -0,0 +1,132 @@
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from sqlalchemy import func, inspect, text, update
+from models import db
+from models.user import User
+from services.passwords import hash_password
+from services.rate_limit import normalize_email
+from services.sql import dialect_insert, lock_schema
+
+logger = logging.getLogger(__name__)
+
+# Emails are unique regardless of case, and the admin listing pages on
+# (date_created, id). The indexes are declared on the model for new databases;
+# older ones get them at startup.
+INDEX_DDL = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS ix_user_email_lower ON "user" (lower(email))',
+    'CREATE INDEX IF NOT EXISTS ix_user_date_created_id ON "user" (date_created, id)',
+]
+
+# Postgres only uses a btree for LIKE 'prefix%' with pattern ops (unless the
+# database collation is C), so email-prefix filters get their own index.
+POSTGRES_DDL = [
+    'CREATE INDEX IF NOT EXISTS ix_user_email_lower_pattern ON "user" (lower(email) varchar_pattern_ops)',
+]
+
+# confirm_password used to hold a second copy of the hash and was NOT NULL.
+# On Postgres relaxing the constraint is a catalog-only change; SQLite has no
+# ALTER COLUMN, so the column is dropped and re-added, which rewrites the
+# table (3.35+; SQLite is for development databases only).
+CONFIRM_PASSWORD_POSTGRES_DDL = 'ALTER TABLE "user" ALTER COLUMN confirm_password DROP NOT NULL'
+CONFIRM_PASSWORD_SQLITE_DDL = [
+    'ALTER TABLE "user" DROP COLUMN confirm_password',
+    'ALTER TABLE "user" ADD COLUMN confirm_password VARCHAR(120)',
+]
+
+_rehash_executor = None
+_rehash_lock = Lock()
+
+
+# Accounts whose emails differ only by case, which the unique lower(email)
+# index cannot be built over.
+CASE_DUPLICATES_SQL = (
+    'SELECT lower(email) AS email, count(*) AS accounts FROM "user" '
+    'GROUP BY lower(email) HAVING count(*) > 1 ORDER BY lower(email)'
+)
+
+
+def _index_exists(conn, name):
+    if conn.dialect.name == 'postgresql':
+        query = 'SELECT 1 FROM pg_indexes WHERE indexname = :name'
+    else:
+        query = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"
+    return conn.execute(text(query), {'name': name}).first() is not None
+
+
+def _check_case_duplicates(conn):
+    duplicates = conn.execute(text(CASE_DUPLICATES_SQL + ' LIMIT 10')).all()
+    if duplicates:
+        listed = ', '.join(f'{email} ({accounts} accounts)' for email, accounts in duplicates)
+        raise RuntimeError(
+            'Cannot create the unique index ix_user_email_lower: some emails are registered more than '
+            f'once in different case, e.g. {listed}. Merge or rename those accounts so every email is '
+            f'unique regardless of case (list them all with: {CASE_DUPLICATES_SQL}), then start the app again.'
+        )
+
+
+def init_accounts():
+    with db.engine.begin() as conn:
+        lock_schema(conn)
+        if not _index_exists(conn, 'ix_user_email_lower'):
+            # Only databases from before the index pay for this scan.
+            _check_case_duplicates(conn)
+        for statement in INDEX_DDL:
+            conn.execute(text(statement))
+        if conn.dialect.name == 'postgresql':
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+        columns = {c['name']: c for c in inspect(conn).get_columns('user')}
+        if not columns['confirm_password']['nullable']:
+            _relax_confirm_password(conn)
+
+
+def _relax_confirm_password(conn):
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(CONFIRM_PASSWORD_POSTGRES_DDL))
+        return
+    if sqlite3.sqlite_version_info < (3, 35):
+        raise RuntimeError(
+            f'"user".confirm_password is NOT NULL and SQLite {sqlite3.sqlite_version} cannot drop it '
+            '(3.35+ can). Recreate the development database, or upgrade SQLite, then start the app again.'
+        )
+    for statement in CONFIRM_PASSWORD_SQLITE_DDL:
+        conn.execute(text(statement))
+
+
+def email_is(email):
+    # Lookup predicate matching the unique lower(email) index, so an account
+    # is found however the email is cased (the same rule registration uses).
+    return func.lower(User.email) == normalize_email(email)
+
+
+def create_user(username, email, password_hash):
+    # One round trip: INSERT ... ON CONFLICT DO NOTHING RETURNING. Returns the
+    # new User, or None if the email (in any case) is already registered.
+    # Concurrent signups for one email are settled by the unique index.
+    insert = dialect_insert(User).values(username=username, email=email, password=password_hash)
+    return db.session.scalars(insert.on_conflict_do_nothing().returning(User)).first()
+
+
+def _rehash(app, user_id, old_hash, password):
+    try:
+        new_hash = hash_password(password)
+        with app.app_context():
+            # Compare-and-set: a password changed meanwhile is not overwritten.
+            db.session.execute(update(User).where(User.id == user_id, User.password == old_hash)
+                               .values(password=new_hash))
+            db.session.commit()
+    except Exception:
+        logger.exception('Password rehash failed for user %s', user_id)
+
+
+def schedule_rehash(app, user, password):
+    # Called after a successful check of an outdated hash; the login response
+    # does not wait for the new hash.
+    global _rehash_executor
+    with _rehash_lock:
+        if _rehash_executor is None:
+            _rehash_executor = ThreadPoolExecutor(max_workers=app.config['PASSWORD_REHASH_WORKERS'],
+                                                  thread_name_prefix='rehash')
+    _rehash_executor.submit(_rehash, app, user.id, user.password, password)
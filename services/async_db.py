@@ -0,0 +1,26 @@
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+
+def async_database_uri(app):
+    uri = app.config.get('ASYNC_SQLALCHEMY_DATABASE_URI')
+    if uri:
+        return uri
+    return app.config['SQLALCHEMY_DATABASE_URI'].replace('postgresql://', 'postgresql+asyncpg://', 1)
+
+
+def init_async_db(app):
+    # The engine is created inside the ASGI server's event loop (on lifespan
+    # startup) because asyncpg connections are bound to the loop they open on.
+    engine = create_async_engine(async_database_uri(app), **app.config['ASYNC_ENGINE_OPTIONS'])
+    app.extensions['async_db'] = async_sessionmaker(engine, expire_on_commit=False)
+    return app.extensions['async_db']
+
+
+def async_session(app):
+    return app.extensions['async_db']()
+
+
+async def dispose_async_db(app):
+    sessionmaker = app.extensions.pop('async_db', None)
+    if sessionmaker is not None:
+        await sessionmaker.kw['bind'].dispose()
@@ -1,55 +1,310 @@
-from datetime import datetime, timedelta
-import jwt
-from flask import current_app, jsonify, request
+import base64
+import hashlib
+import hmac
+import json
+import time
+from flask import current_app, g, jsonify, request
 from models.user import User
 from functools import wraps
 
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+    from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
+except ImportError:
+    serialization = None
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def _json_segment(obj):
+    return _b64encode(json.dumps(obj, separators=(',', ':')).encode('utf-8'))
+
+
+class HmacKey:
+    algorithm = 'HS256'
+
+    def __init__(self, kid, secret):
+        self.kid = kid
+        # The keyed inner/outer pads are computed once; each signature copies
+        # this object instead of re-deriving them from the secret.
+        self._mac = hmac.new(secret.encode('utf-8') if isinstance(secret, str) else secret,
+                             digestmod=hashlib.sha256)
+
+    def sign(self, data):
+        mac = self._mac.copy()
+        mac.update(data)
+        return mac.digest()
+
+    def verify(self, data, signature):
+        return hmac.compare_digest(self.sign(data), signature)
+
+
+class Ed25519Key:
+    algorithm = 'EdDSA'
+
+    def __init__(self, kid, private_key=None, public_key=None):
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = public_key or private_key.public_key()
+
+    def sign(self, data):
+        return self.private_key.sign(data)
+
+    def verify(self, data, signature):
+        try:
+            self.public_key.verify(signature, data)
+            return True
+        except InvalidSignature:
+            return False
+
+    def jwk(self):
+        raw = self.public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        return {'kty': 'OKP', 'crv': 'Ed25519', 'x': _b64encode(raw),
+                'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'}
+
+
+class EcP256Key:
+    algorithm = 'ES256'
+
+    def __init__(self, kid, private_key=None, public_key=None):
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = public_key or private_key.public_key()
+
+    def sign(self, data):
+        # JWS wants the raw 64-byte r || s, not cryptography's DER encoding.
+        r, s = decode_dss_signature(self.private_key.sign(data, ec.ECDSA(hashes.SHA256())))
+        return r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+
+    def verify(self, data, signature):
+        if len(signature) != 64:
+            return False
+        der = encode_dss_signature(int.from_bytes(signature[:32], 'big'), int.from_bytes(signature[32:], 'big'))
+        try:
+            self.public_key.verify(der, data, ec.ECDSA(hashes.SHA256()))
+            return True
+        except InvalidSignature:
+            return False
+
+    def jwk(self):
+        numbers = self.public_key.public_numbers()
+        return {'kty': 'EC', 'crv': 'P-256',
+                'x': _b64encode(numbers.x.to_bytes(32, 'big')), 'y': _b64encode(numbers.y.to_bytes(32, 'big')),
+                'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'}
+
+
+def _load_pem(value, private):
+    # value: a PEM string or the path to a PEM file.
+    if value.lstrip().startswith('-----BEGIN'):
+        data = value.encode('utf-8')
+    else:
+        with open(value, 'rb') as f:
+            data = f.read()
+    if private:
+        return serialization.load_pem_private_key(data, password=None)
+    return serialization.load_pem_public_key(data)
+
+
+def load_asymmetric_key(kid, value, private=True):
+    if serialization is None:
+        raise RuntimeError('Asymmetric JWT keys require the cryptography package')
+    key = _load_pem(value, private)
+    public = key.public_key() if private else key
+    kwargs = {'private_key': key} if private else {'public_key': key}
+    if isinstance(public, ed25519.Ed25519PublicKey):
+        return Ed25519Key(kid, **kwargs)
+    if isinstance(public, ec.EllipticCurvePublicKey) and isinstance(public.curve, ec.SECP256R1):
+        return EcP256Key(kid, **kwargs)
+    raise ValueError(f'JWT key {kid!r} must be Ed25519 or EC P-256')
+
+
+class TokenService:
+    # Signs and verifies the API's JWTs (compact JWS with user_id and exp
+    # claims). Keys form a keyring indexed by kid: new tokens are signed with
+    # the active key, and any key still in the ring verifies, so a rotation
+    # does not log anyone out. The JOSE header of each key is constant and
+    # encoded once, and a token is only accepted if its header segment is one
+    # of those, so verification never parses an attacker-chosen header.
+
+    def __init__(self, keys, active_kid, access_ttl, refresh_ttl, legacy_kid=None):
+        self.keys = {key.kid: key for key in keys}
+        self.active = self.keys[active_kid]
+        if getattr(self.active, 'private_key', True) is None:
+            raise ValueError(f'JWT_ACTIVE_KID {active_kid!r} has no private key to sign with')
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self._headers = {}
+        for key in keys:
+            header = _json_segment({'alg': key.algorithm, 'typ': 'JWT', 'kid': key.kid})
+            self._headers[header] = key
+            key.header = header
+        if isinstance(self.keys.get(legacy_kid), HmacKey):
+            # Tokens issued before kids existed carry PyJWT's plain header.
+            self._headers[_json_segment({'alg': 'HS256', 'typ': 'JWT'})] = self.keys[legacy_kid]
+
+        # Published public keys, serialized once; shared secrets never are.
+        jwks = [key.jwk() for key in keys if hasattr(key, 'jwk')]
+        self.jwks = json.dumps({'keys': jwks}, separators=(',', ':')).encode('utf-8') if jwks else None
+        self.jwks_etag = hashlib.sha256(self.jwks).hexdigest()[:32] if jwks else None
+
+    def sign(self, payload):
+        key = self.active
+        signing_input = f'{key.header}.{_json_segment(payload)}'
+        return f'{signing_input}.{_b64encode(key.sign(signing_input.encode("ascii")))}'
+
+    def issue(self, user_id):
+        # The access and refresh token for a login or registration, signed in
+        # one pass with one clock read.
+        now = int(time.time())
+        return (self.sign({'user_id': user_id, 'exp': now + self.access_ttl}),
+                self.sign({'user_id': user_id, 'exp': now + self.refresh_ttl}))
+
+    def issue_access(self, user_id):
+        return self.sign({'user_id': user_id, 'exp': int(time.time()) + self.access_ttl})
+
+    def issue_refresh(self, user_id):
+        return self.sign({'user_id': user_id, 'exp': int(time.time()) + self.refresh_ttl})
+
+    def verify(self, token):
+        # Returns the user id, or None for a malformed, forged or expired token.
+        try:
+            header, payload, signature = token.split('.')
+            key = self._headers.get(header)
+            if key is None or not key.verify(f'{header}.{payload}'.encode('ascii'), _b64decode(signature)):
+                return None
+            claims = json.loads(_b64decode(payload))
+            if not isinstance(claims.get('exp'), (int, float)) or claims['exp'] <= time.time():
+                return None
+            return claims['user_id']
+        except (ValueError, TypeError, KeyError, AttributeError, UnicodeError):
+            return None
+
+
+def init_tokens(app):
+    # Key material is loaded once here. With JWT_PRIVATE_KEYS set, tokens are
+    # signed asymmetrically and anyone holding the JWKS can verify them; HMAC
+    # keys then only verify, and only if JWT_KEYS lists them explicitly.
+    if app.config['JWT_PRIVATE_KEYS']:
+        keys = [load_asymmetric_key(kid, pem) for kid, pem in app.config['JWT_PRIVATE_KEYS'].items()]
+        keys += [load_asymmetric_key(kid, pem, private=False) for kid, pem in (app.config['JWT_PUBLIC_KEYS'] or {}).items()]
+        keys += [HmacKey(kid, secret) for kid, secret in (app.config['JWT_KEYS'] or {}).items()]
+    else:
+        secrets = app.config['JWT_KEYS'] or {'default': app.config['SECRET_KEY']}
+        keys = [HmacKey(kid, secret) for kid, secret in secrets.items()]
+    app.extensions['token_service'] = TokenService(
+        keys,
+        app.config['JWT_ACTIVE_KID'],
+        app.config['JWT_ACCESS_TTL'],
+        app.config['JWT_REFRESH_TTL'],
+        legacy_kid='default',
+    )
+
+
+def token_service():
+    return current_app.extensions['token_service']
+
+def issue_tokens(user):
+    return token_service().issue(user.id)
+
 def generate_access_token(user):
-    payload = {
-        'user_id': user.id,
-        'exp': datetime.utcnow() + timedelta(minutes=15)  
-    }
-    token = jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
-    return token
+    return token_service().issue_access(user.id)
 
 def generate_refresh_token(user):
-    payload = {
-        'user_id': user.id,
-        'exp': datetime.utcnow() + timedelta(hours=1)  
-    }
-    token = jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
-    return token
+    return token_service().issue_refresh(user.id)
 
 def verify_token(token):
-    try:
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload['user_id']
-    except jwt.ExpiredSignatureError:
+    return token_service().verify(token)
+
+def parse_bearer(header):
+    # Fast path for 'Bearer <token>': one partition, no list. Returns None for
+    # anything else, which callers answer with a 401 rather than an IndexError.
+    scheme, _, token = header.partition(' ')
+    if not token or ' ' in token or scheme.lower() != 'bearer':
         return None
-    except jwt.InvalidTokenError:
-        return None  
+    return token
+
+def authenticate_request():
+    header = request.headers.get('Authorization')
+    if not header:
+        return None, (jsonify({'message': 'Token is missing!'}), 401)
+
+    token = parse_bearer(header)
+    if token is None:
+        return None, (jsonify({'message': 'Malformed Authorization header. Expected "Bearer <token>".'}), 401)
+
+    # Requests dispatched internally (e.g. by /batch) share the app context,
+    # so the principal resolved by the first one is reused by the rest.
+    if g.get('auth_token') == token:
+        return g.current_user, None
+
+    started = time.perf_counter()
+    try:
+        user_id = verify_token(token)
+        if not user_id:
+            return None, (jsonify({'message': 'Token is invalid or expired!'}), 401)
+        current_user = User.query.get(user_id)
+        if not current_user:
+            return None, (jsonify({'message': 'User not found!'}), 404)
+    finally:
+        g.auth_time = g.get('auth_time', 0.0) + time.perf_counter() - started
+
+    g.auth_token = token
+    g.current_user = current_user
+    return current_user, None
+
+def _authenticate():
+    try:
+        return authenticate_request()
+    except Exception as e:
+        return None, (jsonify({'message': 'Something went wrong: ' + str(e)}), 500)
 
 def token_required(f):
+    # On protected blueprints the before_request hook has already resolved
+    # the principal, so this only reads it back from g.
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-       
-        if 'Authorization' in request.headers:
-            token = request.headers['Authorization'].split(" ")[1]  
-        
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-        
-        try:
-            user_id = verify_token(token)
-            if not user_id:
-                return jsonify({'message': 'Token is invalid or expired!'}), 401
-            current_user = User.query.get(user_id)
-            if not current_user:
-                return jsonify({'message': 'User not found!'}), 404
-        except Exception as e:
-            return jsonify({'message': 'Something went wrong: ' + str(e)}), 500
-        
+        current_user, error = _authenticate()
+        if error:
+            return error
         return f(current_user, *args, **kwargs)
-    
+
     return decorated
+
+def admin_required(f):
+    @wraps(f)
+    @token_required
+    def decorated(current_user, *args, **kwargs):
+        if current_user.email not in current_app.config['ADMIN_EMAILS']:
+            return jsonify({'message': 'Admin access required!'}), 403
+        return f(current_user, *args, **kwargs)
+
+    return decorated
+
+def _authenticate_protected():
+    if request.blueprint in current_app.extensions['auth_protected'] and request.method != 'OPTIONS':
+        _, error = _authenticate()
+        if error:
+            return error
+
+def _server_timing(response):
+    # Time spent verifying the token and loading the user, as its own metric.
+    auth_time = g.get('auth_time')
+    if auth_time is not None:
+        response.headers.add('Server-Timing', f'auth;dur={auth_time * 1000:.3f}')
+    return response
+
+def init_auth(app, protected):
+    # Every route on a protected blueprint requires a token; it is checked
+    # once per request, before the view. Other blueprints opt in per route
+    # with token_required / admin_required.
+    app.extensions['auth_protected'] = {blueprint.name for blueprint in protected}
+    app.before_request(_authenticate_protected)
+    app.after_request(_server_timing)
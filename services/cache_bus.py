@@ -0,0 +1,240 @@
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from sqlalchemy import event
+from models import db
+from models.cache_version import CacheVersion
+from services.notify import pg_listener, pg_notify, start_listener
+from services.sql import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'cache_invalidation'
+# Per-message budget for invalidation data, under the 8000-byte NOTIFY limit.
+MAX_DATA_BYTES = 6000
+
+
+class UnixSocketBroadcaster:
+    # Broker-less host-local fan-out: every worker binds a datagram socket in
+    # a shared directory and publishing sends to all of them.
+
+    def __init__(self, directory, deliver):
+        self.directory = directory
+        self.deliver = deliver
+        self._sock = None
+        self._path = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._path = os.path.join(self.directory, f'{os.getpid()}.sock')
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self._path)
+        threading.Thread(target=self._run, name='cache-bus-unix', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.deliver(self._sock.recv(65536).decode('utf-8'))
+            except Exception:
+                logger.exception('Cache bus receive failed')
+
+    def publish(self, message):
+        data = message.encode('utf-8')
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for path in glob.glob(os.path.join(self.directory, '*.sock')):
+                if path == self._path:
+                    continue
+                try:
+                    sender.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # The worker behind this socket has exited.
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                except OSError:
+                    logger.exception('Cache bus send to %s failed', path)
+        finally:
+            sender.close()
+
+
+class CacheBus:
+    # Cache keys are hierarchical strings ('products', 'product:42'); a
+    # subscriber for 'product' receives 'product' and every 'product:<...>'.
+    #
+    # invalidate() queues the key on the writer's session. Once the session
+    # commits, the key's row in cache_version is bumped in its own short
+    # transaction (so writers never queue on that row lock), delivered to this
+    # process and published to the others. Subscribers also poll
+    # cache_version, so a message lost in transit is caught within
+    # CACHE_BUS_POLL_INTERVAL.
+    #
+    # Callbacks are called with (key, data). data is the list the writers
+    # passed to invalidate() (e.g. the emails just registered) when this
+    # process has seen every version of the key up to this one; otherwise it
+    # is None and the subscriber must refresh in full.
+
+    def __init__(self):
+        self._subscribers = []
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._app = None
+        self._transport = None
+        self._unix = None
+
+    def subscribe(self, prefix, callback, remote_only=False):
+        # remote_only: the committing process already updated its own copy.
+        self._subscribers.append((prefix, callback, remote_only))
+
+    def invalidate(self, key, session=None, data=None):
+        # data: JSON-serializable items describing the change. A key
+        # invalidated without data in a transaction is delivered without data.
+        session = session or db.session()
+        if not session.in_transaction():
+            # So that a rollback, which fires no events outside a
+            # transaction, still discards the key.
+            session.begin()
+        pending = session.info.setdefault('pending_invalidations', {})
+        if data is None:
+            pending[key] = None
+        elif key not in pending:
+            pending[key] = list(data)
+        elif pending[key] is not None:
+            pending[key].extend(data)
+
+    def _matches(self, prefix, key):
+        return key == prefix or key.startswith(prefix + ':')
+
+    def _dispatch(self, key, version, remote, data=None, first=None):
+        # first..version: the versions this delivery covers (several when a
+        # large data list was split across messages).
+        with self._lock:
+            if version is not None:
+                seen = self._seen.get(key, 0)
+                if version <= seen:
+                    return
+                self._seen[key] = version
+                if (version if first is None else first) != seen + 1:
+                    # Versions in between have not reached this process (or
+                    # never will), so neither have their data: every
+                    # subscriber, this worker's own copies included, refreshes.
+                    remote, data = True, None
+        for prefix, callback, remote_only in self._subscribers:
+            if self._matches(prefix, key) and (remote or not remote_only):
+                try:
+                    callback(key, data)
+                except Exception:
+                    logger.exception('Cache invalidation callback failed for %s', key)
+
+    def _receive(self, message):
+        data = json.loads(message)
+        if data['pid'] != os.getpid():
+            self._dispatch(data['key'], data['version'], remote=True, data=data.get('data'))
+
+    def _chunks(self, data):
+        # NOTIFY payloads are capped at 8000 bytes, so a long data list is
+        # split across several messages, each with its own version.
+        if not data:
+            return [data]
+        chunks, chunk, size = [], [], 0
+        for item in data:
+            item_size = len(json.dumps(item)) + 2
+            if chunk and size + item_size > MAX_DATA_BYTES:
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(item)
+            size += item_size
+        chunks.append(chunk)
+        return chunks
+
+    def _messages(self, key, version, chunks):
+        first = version - len(chunks) + 1
+        return [json.dumps({'pid': os.getpid(), 'key': key, 'version': first + i, 'data': chunk})
+                for i, chunk in enumerate(chunks)]
+
+    def _bump(self, conn, key, count):
+        insert = dialect_insert(CacheVersion).values(key=key, version=count)
+        return conn.execute(insert.on_conflict_do_update(
+            index_elements=['key'], set_={'version': CacheVersion.version + count},
+        ).returning(CacheVersion.version)).scalar()
+
+    def _after_commit(self, session):
+        keys = session.info.pop('pending_invalidations', None)
+        if not keys:
+            return
+        for key, data in keys.items():
+            chunks = self._chunks(data)
+            try:
+                with db.engine.begin() as conn:
+                    version = self._bump(conn, key, len(chunks))
+                    messages = self._messages(key, version, chunks)
+                    if self._transport == 'postgres':
+                        # Sent when the bump commits.
+                        for message in messages:
+                            pg_notify(conn, CHANNEL, message)
+            except Exception:
+                # Without a version the other workers cannot learn of this
+                # change; they catch up at the key's next bump.
+                logger.exception('Cache version bump failed for %s', key)
+                self._dispatch(key, None, remote=False, data=data)
+                continue
+            self._dispatch(key, version, remote=False, data=data, first=version - len(chunks) + 1)
+            if self._transport == 'unix':
+                try:
+                    for message in messages:
+                        self._unix.publish(message)
+                except Exception:
+                    # The version poll will still deliver these to the other workers.
+                    logger.exception('Cache bus publish failed')
+
+    def _after_rollback(self, session):
+        session.info.pop('pending_invalidations', None)
+
+    def _poll(self):
+        while True:
+            time.sleep(self._app.config['CACHE_BUS_POLL_INTERVAL'])
+            try:
+                with self._app.app_context():
+                    rows = db.session.query(CacheVersion.key, CacheVersion.version).all()
+                for key, version in rows:
+                    self._dispatch(key, version, remote=True)
+            except Exception:
+                logger.exception('Cache version poll failed')
+
+    def init_app(self, app):
+        self._app = app
+        self._transport = app.config['CACHE_BUS_TRANSPORT']
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+        if self._transport == 'postgres':
+            pg_listener.subscribe(CHANNEL, self._receive)
+        with app.app_context():
+            self._seen = dict(db.session.query(CacheVersion.key, CacheVersion.version).all())
+        app.before_request(self.ensure_started)
+
+    def ensure_started(self):
+        # Threads do not survive fork, so each worker starts its own
+        # subscriber threads on its first request.
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        if self._transport == 'postgres':
+            start_listener()
+        elif self._transport == 'unix':
+            self._unix = UnixSocketBroadcaster(self._app.config['CACHE_BUS_SOCKET_DIR'], self._receive)
+            self._unix.start()
+        threading.Thread(target=self._poll, name='cache-bus-poll', daemon=True).start()
+
+
+cache_bus = CacheBus()
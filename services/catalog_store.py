@@ -0,0 +1,257 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from models import db
+from models.cache_version import CacheVersion
+from models.product import Product
+from services.cache_bus import cache_bus
+from services.compression import precompress
+from services.fieldsets import serialize_rows
+
+# One catalog snapshot per host, in a single file that every worker maps
+# read-only. Layout:
+#
+#   b'CATL' | u32 header length | JSON header | data
+#
+# The data section holds fixed-size records sorted by product id, a blob of
+# UTF-8 strings the records point into, and the full /products/ response body
+# pre-encoded once per Content-Encoding. Offsets in the header are relative to
+# the start of the data section.
+MAGIC = b'CATL'
+FORMAT = 1
+FIELDS = ('id', 'name', 'description', 'price', 'date_added')
+# id, price, then (offset, length) into the blob for name, description, date_added
+RECORD = struct.Struct('<qdQIQIQI')
+# Offset of a NULL string (date_added is nullable).
+NULL_OFFSET = 2 ** 64 - 1
+
+catalog_cli = AppGroup('catalog', help='Manage the shared catalog snapshot.')
+
+
+class CatalogSnapshot:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:4] != MAGIC:
+            raise ValueError(f'{path} is not a catalog snapshot')
+        (header_length,) = struct.unpack_from('<I', self._mmap, 4)
+        header = json.loads(self._mmap[8:8 + header_length])
+        if header['format'] != FORMAT:
+            raise ValueError(f'Unsupported catalog snapshot format {header["format"]}')
+        self._view = memoryview(self._mmap)[8 + header_length:]
+        self.source_version = header['source_version']
+        # False while the variants are still at the live compression levels.
+        self.final = header.get('final', True)
+        self.count = header['count']
+        self._blob = header['blob']
+        self._variants = header['variants']
+
+    def _string(self, offset, length):
+        if offset == NULL_OFFSET:
+            return None
+        start = self._blob + offset
+        return str(self._view[start:start + length], 'utf-8')
+
+    def _record(self, index):
+        return RECORD.unpack_from(self._view, index * RECORD.size)
+
+    def _row(self, record, fields):
+        product_id, price, name_off, name_len, desc_off, desc_len, date_off, date_len = record
+        values = {'id': product_id, 'price': price}
+        # Only the requested strings are decoded out of the mapping.
+        for field, offset, length in (('name', name_off, name_len),
+                                      ('description', desc_off, desc_len),
+                                      ('date_added', date_off, date_len)):
+            if field in fields:
+                values[field] = self._string(offset, length)
+        return {field: values[field] for field in fields}
+
+    def rows(self, fields):
+        return [self._row(self._record(index), fields) for index in range(self.count)]
+
+    def get(self, product_id, fields=FIELDS):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._record(mid)
+            if record[0] < product_id:
+                lo = mid + 1
+            elif record[0] > product_id:
+                hi = mid
+            else:
+                return self._row(record, fields)
+        return None
+
+    def variants(self):
+        return {encoding: self._view[offset:offset + length] for encoding, (offset, length) in self._variants.items()}
+
+
+class CatalogStore:
+    def __init__(self):
+        self.path = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._wanted = threading.Event()
+        self._builder_pid = None
+        self._app = None
+
+    def init_app(self, app):
+        self.path = app.config['CATALOG_STORE_PATH']
+        if not self.path:
+            return
+        self._app = app
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # A snapshot left from before a restart may be behind the DB; this
+        # only rebuilds it if so.
+        with app.app_context():
+            build_catalog(self.path)
+        cache_bus.subscribe('products', self.request_rebuild)
+
+    def snapshot(self):
+        # Remaps when the builder has replaced the file; one stat() per call.
+        if not self.path:
+            return None
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return None
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.inode != inode:
+            with self._lock:
+                if self._snapshot is None or self._snapshot.inode != inode:
+                    self._snapshot = CatalogSnapshot(self.path)
+                snapshot = self._snapshot
+        return snapshot
+
+    def request_rebuild(self, key=None, data=None):
+        if self._builder_pid != os.getpid():
+            self._builder_pid = os.getpid()
+            threading.Thread(target=self._build_loop, name='catalog-builder', daemon=True).start()
+        self._wanted.set()
+
+    def _build_loop(self):
+        while True:
+            self._wanted.wait()
+            # Writes come in bursts (an import commits batch by batch); let
+            # them settle so that one rebuild covers the burst.
+            time.sleep(self._app.config['CATALOG_REBUILD_DELAY'])
+            self._wanted.clear()
+            try:
+                with self._app.app_context():
+                    # Publish with the live levels first, then spend the top
+                    # levels on a snapshot that is not about to be replaced.
+                    build_catalog(self.path, levels=self._app.config['COMPRESS_LEVELS'])
+                    if not self._wanted.is_set():
+                        finalize_catalog(self.path)
+            except Exception:
+                self._app.logger.exception('Catalog snapshot build failed')
+
+
+catalog_store = CatalogStore()
+
+
+def _products_version():
+    version = db.session.get(CacheVersion, 'products')
+    return version.version if version else 0
+
+
+def _lock(path):
+    import fcntl
+
+    lock = open(path + '.lock', 'w')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+
+def _write_snapshot(path, header, sections, body, levels):
+    # sections: the records and the string blob; the body's variants follow.
+    offset = sum(len(section) for section in sections)
+    sections = list(sections)
+    variants = {}
+    for encoding, data in precompress(body, levels).items():
+        variants[encoding] = [offset, len(data)]
+        sections.append(data)
+        offset += len(data)
+    header = json.dumps(dict(header, format=FORMAT, final=levels is None, variants=variants)).encode('utf-8')
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header)) + header)
+        for section in sections:
+            f.write(section)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def build_catalog(path, force=False, levels=None):
+    # Every worker is told about a catalog change, but they serialize on the
+    # lock file and only the first finds the snapshot older than the DB; the
+    # rest see an up-to-date header and return. Returns True if it rebuilt.
+    # levels: compression levels for the body variants; the default,
+    # COMPRESS_SNAPSHOT_LEVELS, makes a final snapshot.
+    with _lock(path):
+        # Read the version before the products: the snapshot is then at least
+        # as new as the version it claims.
+        source_version = _products_version()
+        if not force and os.path.exists(path):
+            try:
+                if CatalogSnapshot(path).source_version >= source_version:
+                    db.session.rollback()
+                    return False
+            except (ValueError, KeyError):
+                pass
+
+        products = db.session.query(*[getattr(Product, field) for field in FIELDS]).order_by(Product.id).all()
+        db.session.rollback()
+
+        records, blob = bytearray(), bytearray()
+
+        def put(text):
+            if text is None:
+                return NULL_OFFSET, 0
+            data = text.encode('utf-8')
+            offset = len(blob)
+            blob.extend(data)
+            return offset, len(data)
+
+        for product_id, name, description, price, date_added in products:
+            records += RECORD.pack(product_id, price, *put(name), *put(description), *put(date_added.isoformat() if date_added else None))
+
+        body = current_app.json.response(serialize_rows(products, FIELDS)).get_data()
+        header = {'source_version': source_version, 'count': len(products), 'blob': len(records)}
+        _write_snapshot(path, header, [bytes(records), bytes(blob)], body, levels)
+        return True
+
+
+def finalize_catalog(path):
+    # Re-encodes a snapshot built with the live levels at
+    # COMPRESS_SNAPSHOT_LEVELS, from the file alone. Like build_catalog, only
+    # the first worker to take the lock does the work.
+    with _lock(path):
+        snapshot = CatalogSnapshot(path)
+        if snapshot.final:
+            return False
+        identity_offset, identity_length = snapshot._variants['identity']
+        data = bytes(snapshot._view[:identity_offset])
+        body = bytes(snapshot._view[identity_offset:identity_offset + identity_length])
+        header = {'source_version': snapshot.source_version, 'count': snapshot.count, 'blob': snapshot._blob}
+        _write_snapshot(path, header, [data], body, None)
+        return True
+
+
+@catalog_cli.command('build')
+def build_command():
+    """Rebuild the shared catalog snapshot now."""
+    path = current_app.config['CATALOG_STORE_PATH']
+    if not path:
+        raise click.UsageError('CATALOG_STORE_PATH is not configured')
+    build_catalog(path, force=True)
+    click.echo(f'Wrote {path}')
@@ -0,0 +1,116 @@
+import threading
+from sqlalchemy import event, text
+from models import db
+from models.change_log import ChangeLog
+from models.order import Order
+from models.product import Product
+from services.notify import pg_listener, pg_notify
+
+CHANNEL = 'changes'
+CHANGE_LOCK_ID = 734002
+
+# Tracked models: entity name and, for per-user entities, the owner column.
+TRACKED = {
+    Product: ('product', None),
+    Order: ('order', 'user_id'),
+}
+
+
+class ChangeNotifier:
+    # Parks long-polling requests on a condition variable until a change
+    # commits, locally or (via LISTEN/NOTIFY) in another process.
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def notify(self, payload=None):
+        with self._condition:
+            self._version += 1
+            self._condition.notify_all()
+
+    def wait(self, version, timeout):
+        with self._condition:
+            return self._condition.wait_for(lambda: self._version != version, timeout)
+
+
+change_notifier = ChangeNotifier()
+
+
+def record_changes(session, rows):
+    # rows: [{'entity', 'entity_id', 'op', 'owner_id'}], queued until the
+    # session commits.
+    if rows:
+        session.info.setdefault('pending_changes', []).extend(rows)
+
+
+def _write_changes(session):
+    # On Postgres, writers serialize on an advisory lock taken before their
+    # sequence values are drawn and held until commit, so seq order matches
+    # commit order and a reader's cursor can never jump past a change that
+    # commits later. The rows are written just before the commit so that the
+    # lock covers only the commit, not the rest of the writer's transaction.
+    rows = session.info.pop('pending_changes', None)
+    if not rows:
+        return
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': CHANGE_LOCK_ID})
+        pg_notify(connection, CHANNEL)
+    connection.execute(ChangeLog.__table__.insert(), rows)
+    session.info['changes_pending'] = True
+
+
+def _rows(objects, op):
+    rows = []
+    for obj in objects:
+        tracked = TRACKED.get(type(obj))
+        if tracked is None:
+            continue
+        entity, owner_column = tracked
+        rows.append({
+            'entity': entity,
+            'entity_id': obj.id,
+            'op': op,
+            'owner_id': getattr(obj, owner_column) if owner_column else None,
+        })
+    return rows
+
+
+def _after_flush(session, flush_context):
+    # session.new / session.dirty still hold the pre-flush state here, but
+    # primary keys have been assigned.
+    rows = _rows(session.new, 'insert')
+    rows += _rows([obj for obj in session.dirty if session.is_modified(obj, include_collections=False)], 'update')
+    record_changes(session, rows)
+
+
+def _before_commit(session):
+    # commit() would flush after this hook; flush first so the changes it
+    # records are written too.
+    session.flush()
+    _write_changes(session)
+
+
+def _after_commit(session):
+    if session.info.pop('changes_pending', False):
+        change_notifier.notify()
+
+
+def _after_rollback(session):
+    session.info.pop('pending_changes', None)
+    session.info.pop('changes_pending', None)
+
+
+def init_changes(app):
+    event.listen(db.session, 'after_flush', _after_flush)
+    event.listen(db.session, 'before_commit', _before_commit)
+    event.listen(db.session, 'after_commit', _after_commit)
+    event.listen(db.session, 'after_rollback', _after_rollback)
+    pg_listener.subscribe(CHANNEL, change_notifier.notify)
+    # Anything may have changed while the listener was disconnected.
+    pg_listener.on_reconnect(change_notifier.notify)
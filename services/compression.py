@@ -0,0 +1,159 @@
+import zlib
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def available_encodings():
+    encodings = ['gzip']
+    if brotli is not None:
+        encodings.append('br')
+    if zstandard is not None:
+        encodings.append('zstd')
+    return encodings
+
+
+def negotiate_encoding(allowed=None, accept=None):
+    # Highest client q-value wins; ties go to the server's preference order.
+    # accept is a parsed Accept-Encoding header, by default the request's.
+    allowed = allowed if allowed is not None else available_encodings()
+    accept = accept if accept is not None else request.accept_encodings
+    best, best_q = None, 0
+    for encoding in current_app.config['COMPRESS_ALGORITHMS']:
+        if encoding not in allowed:
+            continue
+        q = accept.quality(encoding)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _level(encoding):
+    return current_app.config['COMPRESS_LEVELS'][encoding]
+
+
+def compress(data, encoding, level):
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f'Unsupported encoding: {encoding}')
+
+
+def _compress_stream(chunks, encoding, level):
+    # Flush after every chunk so long-polling and NDJSON clients still see
+    # each piece as soon as the view yields it.
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    elif encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    elif encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        yield compressor.flush()
+
+
+def _encode_chunks(iterable, charset='utf-8'):
+    for chunk in iterable:
+        yield chunk.encode(charset) if isinstance(chunk, str) else chunk
+
+
+def precompress(data, levels=None):
+    # Encode a cached body once for every supported encoding so that cache
+    # hits never pay for compression again. levels defaults to
+    # COMPRESS_SNAPSHOT_LEVELS.
+    levels = levels or current_app.config['COMPRESS_SNAPSHOT_LEVELS']
+    variants = {'identity': data}
+    for encoding in available_encodings():
+        variants[encoding] = compress(data, encoding, levels[encoding])
+    return variants
+
+
+def choose_variant(variants, accept=None):
+    # Returns (body, encoding); encoding is None for the identity variant.
+    encoding = negotiate_encoding([e for e in variants if e != 'identity'], accept)
+    return bytes(variants[encoding or 'identity']), encoding
+
+
+def variant_response(variants, mimetype='application/json'):
+    body, encoding = choose_variant(variants)
+    response = Response(body, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _compressible_status(status):
+    return status >= 200 and status not in (204, 206, 304)
+
+
+def _should_compress(response):
+    if not _compressible_status(response.status_code):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    return response.mimetype in current_app.config['COMPRESS_MIMETYPES']
+
+
+def compress_response(response):
+    if not _should_compress(response):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if not response.is_streamed and response.calculate_content_length() < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    encoding = negotiate_encoding()
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(_encode_chunks(response.response), encoding, _level(encoding))
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compress(response.get_data(), encoding, _level(encoding)))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def compress_body(data, status, mimetype, accept):
+    # compress_response for bodies sent without a Flask response (the native
+    # ASGI handlers). Returns (data, headers to add).
+    config = current_app.config
+    if not config['COMPRESS_ENABLED'] or not _compressible_status(status) \
+            or mimetype not in config['COMPRESS_MIMETYPES']:
+        return data, {}
+    headers = {'Vary': 'Accept-Encoding'}
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return data, headers
+    encoding = negotiate_encoding(accept=accept)
+    if encoding:
+        data = compress(data, encoding, _level(encoding))
+        headers['Content-Encoding'] = encoding
+    return data, headers
+
+
+def init_compression(app):
+    if app.config['COMPRESS_ENABLED']:
+        app.after_request(compress_response)
@@ -0,0 +1,31 @@
+import psycopg2
+from psycopg2 import extensions
+from gevent.socket import wait_read, wait_write
+import gevent
+from services import passwords
+
+
+def gevent_wait_callback(conn, timeout=None):
+    # Lets psycopg2 yield to the gevent hub while it waits on the socket
+    # instead of blocking the whole process inside libpq.
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f'Bad result from poll: {state!r}')
+
+
+def run_in_threadpool(func, *args):
+    # gevent's hub thread pool uses real OS threads, and bcrypt releases the
+    # GIL, so hashing proceeds in parallel while other greenlets keep running.
+    return gevent.get_hub().threadpool.apply(func, args)
+
+
+def init_cooperative():
+    extensions.set_wait_callback(gevent_wait_callback)
+    passwords.set_offload(run_in_threadpool)
@@ -0,0 +1,119 @@
+import hashlib
+import math
+import os
+import threading
+from models import db
+from models.user import User
+from services.cache_bus import cache_bus
+from services.rate_limit import normalize_email
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k positions from the two halves of one digest.
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RegisteredEmails:
+    # Negative cache for login: a Bloom filter of every registered email. A
+    # miss means the account certainly does not exist and the user query can
+    # be skipped; a hit may be a false positive and still goes to the DB.
+    #
+    # This worker's own registrations are added in place, and other workers'
+    # arrive as 'users' invalidations on the cache bus carrying the new
+    # emails. The filter is only rebuilt (in the background, every lookup
+    # falling through to the DB until it lands) when it outgrows its capacity
+    # or the bus reports changes without their emails.
+
+    def __init__(self):
+        self._app = None
+        self._filter = None
+        self._dirty = 0
+        self._built = 0
+        self._wanted = threading.Event()
+        self._builder_pid = None
+        self._rebuilding = False
+
+    def init_app(self, app):
+        if not app.config['EMAIL_FILTER_ENABLED']:
+            return
+        self._app = app
+        with app.app_context():
+            self.rebuild()
+        cache_bus.subscribe('users', self._registered_elsewhere, remote_only=True)
+
+    def rebuild(self):
+        generation = self._dirty
+        self._rebuilding = True
+        try:
+            count = db.session.query(User.id).count()
+            bloom = BloomFilter(max(count * 2, self._app.config['EMAIL_FILTER_MIN_CAPACITY']),
+                                self._app.config['EMAIL_FILTER_ERROR_RATE'])
+            for (email,) in db.session.query(User.email).yield_per(10000):
+                bloom.add(normalize_email(email))
+            db.session.rollback()
+            self._filter = bloom
+            self._built = generation
+        finally:
+            self._rebuilding = False
+
+    def _registered_elsewhere(self, key, emails):
+        if emails is None:
+            self.mark_stale()
+            return
+        for email in emails:
+            self.add(email)
+
+    def mark_stale(self):
+        self._dirty += 1
+        if self._builder_pid != os.getpid():
+            self._builder_pid = os.getpid()
+            threading.Thread(target=self._build_loop, name='email-filter-builder', daemon=True).start()
+        self._wanted.set()
+
+    def _build_loop(self):
+        while True:
+            self._wanted.wait()
+            self._wanted.clear()
+            try:
+                with self._app.app_context():
+                    self.rebuild()
+            except Exception:
+                self._app.logger.exception('Email filter rebuild failed')
+
+    def add(self, email):
+        bloom = self._filter
+        if bloom is None:
+            return
+        bloom.add(normalize_email(email))
+        if bloom.count > bloom.capacity or self._rebuilding:
+            # Past capacity the false-positive rate climbs, so rebuild larger.
+            # A rebuild already scanning may have missed this email.
+            self.mark_stale()
+
+    def might_exist(self, email):
+        bloom = self._filter
+        if bloom is None or self._built != self._dirty:
+            return True
+        return normalize_email(email) in bloom
+
+
+registered_emails = RegisteredEmails()
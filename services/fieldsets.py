@@ -0,0 +1,31 @@
+from datetime import datetime
+from flask import request
+
+
+def requested_fields(allowed):
+    return parse_fields(request.args.get('fields'), allowed)
+
+
+def parse_fields(raw, allowed):
+    if not raw:
+        return list(allowed)
+
+    fields = list(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed fields: {', '.join(allowed)}")
+    return fields
+
+
+def columns(model, fields):
+    # Projecting columns instead of entities keeps unrequested columns (e.g. a
+    # product's description TEXT) out of the SELECT entirely.
+    return [getattr(model, field) for field in fields]
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def serialize_rows(rows, fields):
+    return [{field: _value(value) for field, value in zip(fields, row)} for row in rows]
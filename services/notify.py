@@ -0,0 +1,89 @@
+import logging
+import select
+import threading
+import time
+from sqlalchemy import text
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+def pg_notify(connection, channel, payload=''):
+    # NOTIFY is transactional: listeners only see it once the transaction commits.
+    connection.execute(text('SELECT pg_notify(:channel, :payload)'), {'channel': channel, 'payload': payload})
+
+
+class PgListener:
+    # One LISTEN connection per process, opened outside the pool, fanning
+    # notifications out to in-process callbacks from a daemon thread.
+
+    def __init__(self):
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._engine = None
+        self._on_reconnect = []
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._callbacks.setdefault(channel, []).append(callback)
+
+    def on_reconnect(self, callback):
+        # Called after every (re)connect: notifications sent while the
+        # connection was down are lost, so subscribers must resynchronize.
+        self._on_reconnect.append(callback)
+
+    def start(self, engine):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._engine = engine
+            self._thread = threading.Thread(target=self._run, name='pg-listener', daemon=True)
+            self._thread.start()
+
+    def _connect(self):
+        cargs, cparams = self._engine.dialect.create_connect_args(self._engine.url)
+        conn = self._engine.dialect.connect(*cargs, **cparams)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for channel in list(self._callbacks):
+                cursor.execute(f'LISTEN "{channel}"')
+        return conn
+
+    def _run(self):
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                backoff = 1
+                for callback in self._on_reconnect:
+                    callback()
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        for callback in self._callbacks.get(notification.channel, []):
+                            try:
+                                callback(notification.payload)
+                            except Exception:
+                                logger.exception('Notification callback failed for %s', notification.channel)
+            except Exception:
+                logger.exception('LISTEN connection lost; reconnecting in %ss', backoff)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+pg_listener = PgListener()
+
+
+def start_listener():
+    if db.engine.dialect.name == 'postgresql':
+        pg_listener.start(db.engine)
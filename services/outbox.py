@@ -0,0 +1,238 @@
+import json
+import os
+import socket
+import time
+import urllib.request
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, text
+from models import db
+from models.outbox import OutboxEvent, OutboxCheckpoint
+from services.changes import CHANGE_LOCK_ID
+
+outbox_cli = AppGroup('outbox', help='Relay order events from the transactional outbox.')
+
+
+def add_order_events(orders):
+    # Called in the add_orders transaction after a flush, so the events commit
+    # (or roll back) together with the orders they describe. They are queued
+    # until the session commits.
+    db.session.info.setdefault('pending_outbox', []).extend(
+        {
+            'event_type': 'order.created',
+            'aggregate_id': order.id,
+            'payload': json.dumps({
+                'id': order.id,
+                'product_id': order.product_id,
+                'user_id': order.user_id,
+                'quantity': order.quantity,
+                'status': order.status,
+                'date_created': order.date_created.isoformat()
+            }),
+        }
+        for order in orders
+    )
+
+
+def _before_commit(session):
+    # Event ids are drawn just before the commit under the change-feed lock
+    # (see services.changes), which is held until the commit completes, so
+    # ids become visible in id order: once the relay sees an event, every
+    # lower id has committed or rolled back. SQLite has one writer at a
+    # time and gets the same order without the lock.
+    rows = session.info.pop('pending_outbox', None)
+    if not rows:
+        return
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': CHANGE_LOCK_ID})
+    connection.execute(OutboxEvent.__table__.insert(), rows)
+
+
+def _after_rollback(session):
+    session.info.pop('pending_outbox', None)
+
+
+def _serialize(event):
+    return {
+        'event_id': event.id,
+        'event_type': event.event_type,
+        'aggregate_id': event.aggregate_id,
+        'date_created': event.date_created.isoformat(),
+        'payload': json.loads(event.payload),
+    }
+
+
+class FileSink:
+    def __init__(self, path):
+        self.path = path
+
+    def deliver(self, events):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(_serialize(event)) + '\n' for event in events))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        pass
+
+
+class WebhookSink:
+    # Stand-in for a downstream HTTP consumer: POSTs each batch as one JSON array.
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def deliver(self, events):
+        body = json.dumps([_serialize(event) for event in events]).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise RuntimeError(f'Webhook returned {response.status}')
+
+    def close(self):
+        pass
+
+
+class UnixSocketSink:
+    def __init__(self, path):
+        self.path = path
+        self._sock = None
+
+    def deliver(self, events):
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(self.path)
+        try:
+            self._sock.sendall(''.join(json.dumps(_serialize(event)) + '\n' for event in events).encode('utf-8'))
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+SINKS = {'file': FileSink, 'webhook': WebhookSink, 'unix': UnixSocketSink}
+
+
+def parse_sink(spec):
+    kind, _, target = spec.partition(':')
+    if kind not in SINKS or not target:
+        raise ValueError(f"Invalid sink {spec!r}; expected one of {', '.join(k + ':<target>' for k in SINKS)}")
+    return SINKS[kind](target)
+
+
+def relay_batch(sink, consumer, batch_size):
+    # Delivers the next batch after the consumer's checkpoint and advances the
+    # checkpoint only once the sink accepted it (at-least-once). Locking the
+    # checkpoint row keeps a second relay for the same consumer from
+    # delivering the same batch concurrently. Ids commit in order (see
+    # _before_commit), so no event can later appear behind the checkpoint.
+    checkpoint = db.session.get(OutboxCheckpoint, consumer, with_for_update=True)
+    if checkpoint is None:
+        checkpoint = OutboxCheckpoint(consumer=consumer, last_event_id=0)
+        db.session.add(checkpoint)
+
+    events = (OutboxEvent.query
+              .filter(OutboxEvent.id > checkpoint.last_event_id)
+              .order_by(OutboxEvent.id).limit(batch_size).all())
+    if not events:
+        db.session.commit()
+        return 0
+
+    try:
+        sink.deliver(events)
+    except Exception:
+        db.session.rollback()
+        raise
+    checkpoint.last_event_id = events[-1].id
+    db.session.commit()
+    return len(events)
+
+
+class RelayMetrics:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.delivered = 0
+        self.batches = 0
+        self.failures = 0
+        self.deliver_seconds = 0.0
+
+    def report(self, lag):
+        elapsed = time.monotonic() - self.started
+        rate = self.delivered / elapsed if elapsed else 0.0
+        avg_ms = self.deliver_seconds / self.batches * 1000 if self.batches else 0.0
+        return (f'delivered={self.delivered} batches={self.batches} failures={self.failures} '
+                f'rate={rate:.1f}/s avg_batch_ms={avg_ms:.1f} lag={lag}')
+
+
+def _lag(consumer):
+    latest = db.session.query(db.func.max(OutboxEvent.id)).scalar() or 0
+    checkpoint = db.session.get(OutboxCheckpoint, consumer)
+    db.session.commit()
+    return latest - (checkpoint.last_event_id if checkpoint else 0)
+
+
+def init_outbox(app):
+    event.listen(db.session, 'before_commit', _before_commit)
+    event.listen(db.session, 'after_rollback', _after_rollback)
+
+
+@outbox_cli.command('relay')
+@click.option('--sink', 'sink_spec', required=True, help='file:<path>, webhook:<url> or unix:<socket path>')
+@click.option('--consumer', default='default', show_default=True, help='Checkpoint name for this downstream')
+@click.option('--batch-size', type=int, default=None)
+@click.option('--once', is_flag=True, help='Drain the outbox and exit')
+def relay_command(sink_spec, consumer, batch_size, once):
+    """Deliver outbox events to a sink in batches."""
+    config = current_app.config
+    sink = parse_sink(sink_spec)
+    batch_size = batch_size or config['OUTBOX_BATCH_SIZE']
+    metrics = RelayMetrics()
+    last_report = time.monotonic()
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                delivered = relay_batch(sink, consumer, batch_size)
+            except Exception as e:
+                metrics.failures += 1
+                click.echo(f'Delivery failed, retrying: {e}', err=True)
+                time.sleep(config['OUTBOX_RETRY_INTERVAL'])
+                continue
+
+            if delivered:
+                metrics.batches += 1
+                metrics.delivered += delivered
+                metrics.deliver_seconds += time.monotonic() - started
+
+            if time.monotonic() - last_report >= config['OUTBOX_REPORT_INTERVAL']:
+                click.echo(metrics.report(_lag(consumer)))
+                last_report = time.monotonic()
+
+            if delivered < batch_size:
+                if once:
+                    break
+                time.sleep(config['OUTBOX_POLL_INTERVAL'])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+        click.echo(metrics.report(_lag(consumer)))
+
+
+@outbox_cli.command('prune')
+def prune_command():
+    """Delete events every consumer has already checkpointed past."""
+    safe = db.session.query(db.func.min(OutboxCheckpoint.last_event_id)).scalar()
+    if not safe:
+        click.echo('No checkpoints; nothing pruned')
+        return
+    deleted = OutboxEvent.query.filter(OutboxEvent.id <= safe).delete()
+    db.session.commit()
+    click.echo(f'Pruned {deleted} events')
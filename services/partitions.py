@@ -0,0 +1,277 @@
+import gzip
+import os
+import re
+import threading
+import time
+from datetime import date
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+from models import db
+
+# Postgres-only: monthly RANGE partitions of "order" on date_created, named
+# order_pYYYY_MM, plus a DEFAULT partition so inserts never fail for want of one.
+# Every worker re-checks the months ahead every ORDERS_PARTITION_CHECK_INTERVAL
+# seconds, so the default partition only catches orders dated outside them.
+PARTITION_NAME = re.compile(r'^order_p(\d{4})_(\d{2})$')
+PARTITION_LOCK_ID = 734001
+
+_maintainer_pid = None
+_maintainer_lock = threading.Lock()
+
+orders_cli = AppGroup('orders', help='Manage order table partitions.')
+
+
+def _month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'order_p{month.year:04d}_{month.month:02d}'
+
+
+def partition_bounds(name):
+    match = PARTITION_NAME.match(name)
+    if not match:
+        raise ValueError(f'Not an order partition name: {name}')
+    month = date(int(match.group(1)), int(match.group(2)), 1)
+    return month, _add_months(month, 1)
+
+
+def _create_partition(conn, month):
+    name, start, end = partition_name(month), month.isoformat(), _add_months(month, 1).isoformat()
+    bounds = f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    if not _has_default(conn):
+        conn.execute(text(f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF "order" {bounds}'))
+        return
+
+    # Orders for the month may already sit in the default partition, and
+    # Postgres refuses to attach a partition whose range the default still
+    # holds rows for. Inserts into the default wait on the lock while they are
+    # moved into the new table, which is then attached.
+    conn.execute(text('LOCK TABLE order_default IN SHARE ROW EXCLUSIVE MODE'))
+    conn.execute(text(f'CREATE TABLE {name} (LIKE "order" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    conn.execute(text(
+        f'WITH moved AS (DELETE FROM order_default WHERE date_created >= :start AND date_created < :end '
+        f'RETURNING *) INSERT INTO {name} SELECT * FROM moved'
+    ), {'start': start, 'end': end})
+    conn.execute(text(f'ALTER TABLE "order" ATTACH PARTITION {name} {bounds}'))
+
+
+def _has_default(conn):
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partdefid WHERE c.relname = 'order_default'"
+    )).first() is not None
+
+
+def is_partitioned(conn):
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'order'"
+    )).first() is not None
+
+
+def list_partitions(conn):
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'order'"
+    ))
+    return sorted(name for (name,) in rows if PARTITION_NAME.match(name))
+
+
+def list_detached(conn):
+    # Partition tables left behind by an archive run that stopped between
+    # the detach and the drop.
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_class c WHERE c.relkind = 'r' AND c.relname LIKE 'order\\_p%' "
+        "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)"
+    ))
+    return sorted(name for (name,) in rows if PARTITION_NAME.match(name))
+
+
+def convert_to_partitioned(months_ahead):
+    # One-off migration of an existing plain "order" table. The id sequence is
+    # detached from the old table first so dropping it does not drop the sequence.
+    with db.engine.begin() as conn:
+        conn.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': PARTITION_LOCK_ID})
+        if is_partitioned(conn):
+            return False
+        first = conn.execute(text('SELECT min(date_created) FROM "order"')).scalar()
+        conn.execute(text('ALTER TABLE "order" RENAME TO order_unpartitioned'))
+        conn.execute(text('ALTER SEQUENCE order_id_seq OWNED BY NONE'))
+        conn.execute(text(
+            'CREATE TABLE "order" (LIKE order_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (date_created)'
+        ))
+        conn.execute(text('ALTER TABLE "order" ALTER COLUMN date_created SET NOT NULL'))
+        conn.execute(text('ALTER TABLE "order" ADD PRIMARY KEY (id, date_created)'))
+        conn.execute(text('ALTER TABLE "order" ADD FOREIGN KEY (product_id) REFERENCES product (id)'))
+        conn.execute(text('ALTER TABLE "order" ADD FOREIGN KEY (user_id) REFERENCES "user" (id)'))
+        conn.execute(text('CREATE INDEX ix_order_user_id_date_created ON "order" (user_id, date_created)'))
+        conn.execute(text('ALTER SEQUENCE order_id_seq OWNED BY "order".id'))
+        conn.execute(text('CREATE TABLE order_default PARTITION OF "order" DEFAULT'))
+
+        month = _month_start(first or date.today())
+        last = _add_months(_month_start(date.today()), months_ahead)
+        while month <= last:
+            _create_partition(conn, month)
+            month = _add_months(month, 1)
+
+        conn.execute(text('INSERT INTO "order" SELECT * FROM order_unpartitioned'))
+        conn.execute(text('DROP TABLE order_unpartitioned'))
+    return True
+
+
+def ensure_future_partitions(months_ahead):
+    with db.engine.begin() as conn:
+        conn.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': PARTITION_LOCK_ID})
+        if not is_partitioned(conn):
+            return []
+        existing = set(list_partitions(conn))
+        month = _month_start(date.today())
+        created = []
+        for offset in range(months_ahead + 1):
+            target = _add_months(month, offset)
+            if partition_name(target) not in existing:
+                _create_partition(conn, target)
+                created.append(partition_name(target))
+        return created
+
+
+def archive_partitions(before, directory):
+    # Detaches every monthly partition that ends on or before `before`, dumps
+    # it to <directory>/<name>.csv.gz and drops it. The detach commits on its
+    # own, so the lock it takes on "order" is held only for the catalog
+    # change, not for the dump; the table is dropped only once the dump is on
+    # disk. Tables an earlier run detached but did not drop are picked up too.
+    # (DETACH ... CONCURRENTLY is not an option while a default partition exists.)
+    os.makedirs(directory, exist_ok=True)
+    with db.engine.connect() as conn:
+        attached = [name for name in list_partitions(conn) if partition_bounds(name)[1] <= before]
+        detached = [name for name in list_detached(conn) if partition_bounds(name)[1] <= before]
+
+    for name in attached:
+        with db.engine.begin() as conn:
+            conn.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': PARTITION_LOCK_ID})
+            conn.execute(text(f'ALTER TABLE "order" DETACH PARTITION {name}'))
+
+    archived = []
+    for name in sorted(attached + detached):
+        path = os.path.join(directory, f'{name}.csv.gz')
+        raw = db.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            with gzip.open(path + '.tmp', 'wb') as f:
+                cursor.copy_expert(f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER true)', f)
+            with open(path + '.tmp', 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            cursor.execute(f'DROP TABLE {name}')
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+        archived.append(path)
+    return archived
+
+
+def restore_partition(path):
+    name = os.path.basename(path).split('.')[0]
+    start, end = partition_bounds(name)
+    raw = db.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(f'CREATE TABLE {name} (LIKE "order" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        with gzip.open(path, 'rb') as f:
+            cursor.copy_expert(f'COPY {name} FROM STDIN WITH (FORMAT csv, HEADER true)', f)
+        cursor.execute(
+            f'ALTER TABLE "order" ATTACH PARTITION {name} '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+    return name
+
+
+def _maintain(app):
+    while True:
+        time.sleep(app.config['ORDERS_PARTITION_CHECK_INTERVAL'])
+        try:
+            with app.app_context():
+                created = ensure_future_partitions(app.config['ORDERS_PARTITIONS_AHEAD'])
+            if created:
+                app.logger.info('Created order partitions %s', ', '.join(created))
+        except Exception:
+            app.logger.exception('Order partition maintenance failed')
+
+
+def _ensure_maintainer():
+    # Threads do not survive fork, so each worker starts its own on its
+    # first request.
+    global _maintainer_pid
+    if _maintainer_pid == os.getpid():
+        return
+    with _maintainer_lock:
+        if _maintainer_pid == os.getpid():
+            return
+        _maintainer_pid = os.getpid()
+    app = current_app._get_current_object()
+    threading.Thread(target=_maintain, args=(app,), name='order-partitions', daemon=True).start()
+
+
+def init_partitions(app):
+    if app.config['ORDERS_PARTITIONED'] and db.engine.dialect.name == 'postgresql':
+        ensure_future_partitions(app.config['ORDERS_PARTITIONS_AHEAD'])
+        app.before_request(_ensure_maintainer)
+
+
+def _parse_month(value):
+    try:
+        year, month = value.split('-')
+        return date(int(year), int(month), 1)
+    except ValueError:
+        raise click.BadParameter('expected YYYY-MM')
+
+
+@orders_cli.command('partition')
+def partition_command():
+    """Convert the order table to monthly range partitions."""
+    if convert_to_partitioned(current_app.config['ORDERS_PARTITIONS_AHEAD']):
+        click.echo('Order table is now partitioned by month')
+    else:
+        click.echo('Order table is already partitioned')
+
+
+@orders_cli.command('create-partitions')
+@click.option('--months-ahead', type=int, default=None)
+def create_partitions_command(months_ahead):
+    """Create partitions for the coming months."""
+    ahead = months_ahead if months_ahead is not None else current_app.config['ORDERS_PARTITIONS_AHEAD']
+    for name in ensure_future_partitions(ahead):
+        click.echo(f'Created {name}')
+
+
+@orders_cli.command('archive')
+@click.option('--before', required=True, help='YYYY-MM; partitions for earlier months are archived')
+@click.option('--dir', 'directory', default=None)
+def archive_command(before, directory):
+    """Detach old partitions and dump them to compressed files."""
+    for path in archive_partitions(_parse_month(before), directory or current_app.config['ORDERS_ARCHIVE_DIR']):
+        click.echo(f'Archived {path}')
+
+
+@orders_cli.command('restore')
+@click.argument('path')
+def restore_command(path):
+    """Re-attach a partition from an archive file."""
+    click.echo(f'Restored {restore_partition(path)}')
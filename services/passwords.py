@@ -0,0 +1,68 @@
+import secrets
+from flask_bcrypt import Bcrypt
+
+bcrypt = Bcrypt()
+
+# Callable used to run bcrypt off the calling thread, e.g. on gevent's native
+# thread pool so a hash does not stall every greenlet on the hub.
+_offload = None
+
+
+def set_offload(offload):
+    global _offload
+    _offload = offload
+
+
+def _run(func, *args):
+    if _offload is None:
+        return func(*args)
+    return _offload(func, *args)
+
+
+def hash_password(password):
+    return _run(bcrypt.generate_password_hash, password).decode('utf-8')
+
+
+def check_password(password_hash, password):
+    return _run(bcrypt.check_password_hash, password_hash, password)
+
+
+def hash_passwords(passwords, pool):
+    # pool: a thread pool. bcrypt releases the GIL, so its threads hash on
+    # every core; yields hashes in input order.
+    return pool.map(hash_password, passwords)
+
+
+# (BCRYPT_HASH_PREFIX, BCRYPT_LOG_ROUNDS), set by init_passwords; read
+# without an app context because the native ASGI login has none.
+_hash_policy = ('2b', 12)
+
+
+def needs_rehash(password_hash):
+    # True for hashes made with an older bcrypt variant or a lower cost than
+    # BCRYPT_LOG_ROUNDS; higher costs are left alone.
+    wanted_prefix, wanted_cost = _hash_policy
+    try:
+        _, prefix, cost, _ = password_hash.split('$', 3)
+        return prefix != wanted_prefix or int(cost) < wanted_cost
+    except ValueError:
+        return True
+
+
+_dummy_hash = None
+
+
+def init_passwords(app):
+    # Applies BCRYPT_LOG_ROUNDS and hashes the dummy at that cost up front, so
+    # the first unknown-email login is not the slow one.
+    global _dummy_hash, _hash_policy
+    bcrypt.init_app(app)
+    _hash_policy = (app.config['BCRYPT_HASH_PREFIX'], app.config['BCRYPT_LOG_ROUNDS'])
+    _dummy_hash = hash_password(secrets.token_urlsafe(16))
+
+
+def dummy_check(password):
+    # One bcrypt verification against a hash nothing matches, so a login for
+    # an unknown email costs as much as a wrong password.
+    check_password(_dummy_hash, password)
+    return False
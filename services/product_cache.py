@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+from models import db
+from models.product import Product
+from services.cache_bus import cache_bus
+from services.fieldsets import serialize_rows
+
+FIELDS = ('id', 'name', 'description', 'price', 'date_added')
+
+
+def parse_ids(raw, limit):
+    try:
+        ids = list(dict.fromkeys(int(i) for i in raw.split(',') if i.strip()))
+    except ValueError:
+        raise ValueError('ids must be a comma-separated list of integers')
+    if not ids:
+        raise ValueError('ids must not be empty')
+    if len(ids) > limit:
+        raise ValueError(f'At most {limit} ids may be requested at once')
+    return ids
+
+
+class ProductCache:
+    # Per-process LRU of serialized products keyed by id. Entries always hold
+    # every field so any sparse fieldset can be cut from them. Misses are not
+    # cached, so a product added after a miss is found on the next lookup.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.size = 0
+        # Bumped by every clear and evict. Loaders read it before their query
+        # and store only if it has not moved, so rows read before an
+        # invalidation are never cached after it.
+        self.generation = 0
+
+    def init_app(self, app):
+        self.size = app.config['PRODUCT_CACHE_SIZE']
+        # 'products' is bumped on every catalog write; 'product:<id>' lets an
+        # update path evict a single entry.
+        cache_bus.subscribe('products', self.clear)
+        cache_bus.subscribe('product', self.evict)
+
+    def clear(self, key=None, data=None):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def evict(self, key, data=None):
+        _, _, product_id = key.partition(':')
+        if not product_id:
+            return self.clear()
+        with self._lock:
+            self._entries.pop(int(product_id), None)
+            self.generation += 1
+
+    def lookup(self, ids):
+        found, missing = {}, []
+        with self._lock:
+            for product_id in ids:
+                entry = self._entries.get(product_id)
+                if entry is None:
+                    missing.append(product_id)
+                else:
+                    self._entries.move_to_end(product_id)
+                    found[product_id] = entry
+        return found, missing
+
+    def store(self, entries, generation):
+        if not self.size:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            for entry in entries:
+                self._entries[entry['id']] = entry
+                self._entries.move_to_end(entry['id'])
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def get_many(self, ids, fields=FIELDS):
+        # Returns the products that exist, in the order the ids were given.
+        found, missing = self.lookup(ids)
+        if missing:
+            generation = self.generation
+            rows = db.session.query(*[getattr(Product, field) for field in FIELDS]) \
+                .filter(Product.id.in_(missing)).all()
+            loaded = serialize_rows(rows, FIELDS)
+            self.store(loaded, generation)
+            found.update((entry['id'], entry) for entry in loaded)
+        return [{field: found[i][field] for field in fields} for i in ids if i in found]
+
+
+product_cache = ProductCache()
@@ -0,0 +1,186 @@
+import csv
+import io
+import json
+import time
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from models import db
+from models.product import Product
+from services.cache_bus import cache_bus
+from services.changes import record_changes
+from services.sql import dialect_insert, lock_schema
+from services.suggest import suggest_index
+
+IMPORT_COLUMNS = ('sku', 'name', 'description', 'price')
+
+# create_all() only creates missing tables, so databases that predate the sku
+# column get it here.
+SKU_COLUMN_DDL = 'ALTER TABLE product ADD COLUMN sku VARCHAR(64)'
+SKU_INDEX_DDL = 'CREATE UNIQUE INDEX IF NOT EXISTS ix_product_sku ON product (sku)'
+
+
+def init_product_import():
+    # Runs in every worker as it boots. On Postgres the schema lock makes the
+    # check and the ALTER one step; SQLite has no ADD COLUMN IF NOT EXISTS, so
+    # a worker that loses the race there finds the column already added.
+    with db.engine.begin() as conn:
+        lock_schema(conn)
+        if 'sku' in {c['name'] for c in inspect(conn).get_columns('product')}:
+            return
+        try:
+            conn.execute(text(SKU_COLUMN_DDL))
+        except OperationalError as e:
+            if 'duplicate column' not in str(e):
+                raise
+        conn.execute(text(SKU_INDEX_DDL))
+
+
+def _text_stream(stream):
+    # The request body is read in buffered chunks and decoded incrementally;
+    # it is never held in memory as a whole.
+    return io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8', newline='')
+
+
+def parse_ndjson(stream):
+    for line_number, line in enumerate(_text_stream(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'Invalid JSON'
+            continue
+        if not isinstance(data, dict):
+            yield line_number, None, 'Each line must be a JSON object'
+            continue
+        yield line_number, data, None
+
+
+def parse_csv(stream):
+    reader = csv.DictReader(_text_stream(stream))
+    missing = [c for c in IMPORT_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+    for data in reader:
+        yield reader.line_num, data, None
+
+
+PARSERS = {
+    'application/x-ndjson': parse_ndjson,
+    'application/jsonl': parse_ndjson,
+    'text/csv': parse_csv,
+}
+
+
+def validate_row(data):
+    sku, name, description = data.get('sku'), data.get('name'), data.get('description')
+    if not isinstance(sku, str) or not sku.strip() or len(sku.strip()) > 64:
+        raise ValueError('sku must be a non-empty string of at most 64 characters')
+    if not isinstance(name, str) or not name.strip() or len(name) > 120:
+        raise ValueError('name must be a non-empty string of at most 120 characters')
+    if not isinstance(description, str):
+        raise ValueError('description must be a string')
+    price = data.get('price')
+    if isinstance(price, bool):
+        raise ValueError('price must be a number')
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        raise ValueError('price must be a number')
+    if not price >= 0:
+        raise ValueError('price must not be negative')
+    return {'sku': sku.strip(), 'name': name, 'description': description, 'price': price}
+
+
+def _upsert_batch(batch):
+    # batch: {sku: row}; deduplicated because ON CONFLICT cannot touch the same
+    # row twice in one statement.
+    skus = list(batch)
+    existing = {sku for (sku,) in db.session.query(Product.sku).filter(Product.sku.in_(skus))}
+    insert = dialect_insert(Product)
+    statement = insert.on_conflict_do_update(
+        index_elements=['sku'],
+        set_={'name': insert.excluded.name, 'description': insert.excluded.description,
+              'price': insert.excluded.price},
+    ).returning(Product.id, Product.sku, Product.name)
+    results = db.session.execute(statement, list(batch.values())).all()
+
+    # Core statements bypass the ORM flush hooks, so the change feed and the
+    # caches are told explicitly.
+    record_changes(db.session, [{
+        'entity': 'product',
+        'entity_id': product_id,
+        'op': 'update' if sku in existing else 'insert',
+        'owner_id': None,
+    } for product_id, sku, _ in results])
+    cache_bus.invalidate('products')
+    db.session.commit()
+
+    for product_id, sku, name in results:
+        if sku not in existing:
+            suggest_index.add(product_id, name)
+    if existing:
+        suggest_index.mark_stale()
+    return len(results) - len(existing), len(existing)
+
+
+def _until_unreadable(records, report):
+    # Passes records through until the body cannot be decoded or parsed any
+    # further, and records why in the report. Batches already committed stay
+    # committed.
+    try:
+        yield from records
+    except (ValueError, csv.Error) as e:
+        report['error'] = str(e)
+
+
+def import_products(records, batch_size, max_errors):
+    # records: iterable of (row number, data, parse error) from a parser.
+    # The report carries an 'error' if the body stopped being readable part
+    # way through; every valid row before that point is still imported, and
+    # 'committed' counts them.
+    started = time.monotonic()
+    report = {'rows': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'batches': 0, 'errors': []}
+
+    def fail(row_number, data, message):
+        report['failed'] += 1
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'row': row_number, 'sku': (data or {}).get('sku'), 'error': message})
+
+    # sku -> row number of its first occurrence. Later rows for the same sku
+    # are rejected rather than silently overwriting it.
+    seen = {}
+    batch = {}
+    for row_number, data, error in _until_unreadable(records, report):
+        report['rows'] += 1
+        if error:
+            fail(row_number, data, error)
+            continue
+        try:
+            row = validate_row(data)
+        except ValueError as e:
+            fail(row_number, data, str(e))
+            continue
+        if row['sku'] in seen:
+            fail(row_number, data, f"Duplicate sku; already imported from row {seen[row['sku']]}")
+            continue
+        seen[row['sku']] = row_number
+        batch[row['sku']] = row
+        if len(batch) >= batch_size:
+            inserted, updated = _upsert_batch(batch)
+            report['inserted'] += inserted
+            report['updated'] += updated
+            report['batches'] += 1
+            batch = {}
+    if batch:
+        inserted, updated = _upsert_batch(batch)
+        report['inserted'] += inserted
+        report['updated'] += updated
+        report['batches'] += 1
+    if 'error' in report:
+        report['committed'] = report['inserted'] + report['updated']
+
+    elapsed = time.monotonic() - started
+    report['elapsed_seconds'] = round(elapsed, 3)
+    report['rows_per_second'] = round(report['rows'] / elapsed, 1) if elapsed else None
+    return report
@@ -0,0 +1,152 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func
+from models import db
+from models.user import User
+from services.cache_bus import cache_bus
+from services.email_filter import registered_emails
+from services.passwords import hash_passwords
+from services.sql import dialect_insert
+
+users_cli = AppGroup('users', help='Manage user accounts.')
+
+_hash_executor = None
+_hash_lock = Lock()
+
+
+def _hash_pool(workers):
+    # One pool per process, created on first use and sized by the first
+    # caller. Threads rather than processes: nothing is re-imported or
+    # re-initialized per worker, and bcrypt runs without the GIL.
+    global _hash_executor
+    with _hash_lock:
+        if _hash_executor is None:
+            _hash_executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count(),
+                                                thread_name_prefix='provision-hash')
+    return _hash_executor
+
+
+def _validate(data):
+    if not isinstance(data, dict):
+        raise ValueError('Each user must be an object')
+    for field, limit in (('username', 80), ('email', 120), ('password', None)):
+        value = data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f'{field} must be a non-empty string')
+        if limit and len(value) > limit:
+            raise ValueError(f'{field} must be at most {limit} characters')
+    return {'username': data['username'], 'email': data['email'].strip(), 'password': data['password']}
+
+
+def _insert_batch(rows):
+    # ON CONFLICT covers emails registered since the uniqueness check ran.
+    insert = dialect_insert(User)
+    created = {email for (email,) in db.session.execute(
+        insert.on_conflict_do_nothing().returning(User.email), rows,
+    )}
+    if created:
+        cache_bus.invalidate('users', data=sorted(created))
+    db.session.commit()
+    for email in created:
+        registered_emails.add(email)
+    return created
+
+
+def provision_users(records, batch_size, workers=None, progress=None):
+    # records: list of user dicts. Passwords are hashed on a thread pool and
+    # inserted batch_size at a time, one transaction per batch; progress, if
+    # given, is called with the running report after every batch.
+    started = time.monotonic()
+    report = {'total': len(records), 'created': 0, 'failed': 0, 'batches': 0, 'errors': []}
+
+    def fail(index, email, message):
+        report['failed'] += 1
+        report['errors'].append({'index': index, 'email': email, 'error': message})
+
+    candidates, seen = [], set()
+    for index, data in enumerate(records):
+        try:
+            user = _validate(data)
+        except ValueError as e:
+            fail(index, data.get('email') if isinstance(data, dict) else None, str(e))
+            continue
+        if user['email'].lower() in seen:
+            fail(index, user['email'], 'Duplicate email in request')
+            continue
+        seen.add(user['email'].lower())
+        candidates.append((index, user))
+
+    # One query on the lower(email) index checks the whole request against
+    # existing accounts.
+    registered = {email for (email,) in db.session.query(func.lower(User.email))
+                  .filter(func.lower(User.email).in_(seen))} if seen else set()
+    db.session.rollback()
+    pending = []
+    for index, user in candidates:
+        if user['email'].lower() in registered:
+            fail(index, user['email'], 'Email already registered')
+        else:
+            pending.append((index, user))
+
+    def flush(batch):
+        created = _insert_batch([row for _, row in batch])
+        for index, row in batch:
+            if row['email'] not in created:
+                fail(index, row['email'], 'Email already registered')
+        report['created'] += len(created)
+        report['batches'] += 1
+        elapsed = time.monotonic() - started
+        report['elapsed_seconds'] = round(elapsed, 3)
+        report['users_per_second'] = round(report['created'] / elapsed, 1) if elapsed else None
+        if progress:
+            progress(report)
+
+    report['elapsed_seconds'], report['users_per_second'] = 0, None
+    if pending:
+        batch = []
+        hashes = hash_passwords([user['password'] for _, user in pending], _hash_pool(workers))
+        # Hashing runs ahead on the pool while earlier batches are inserted.
+        for (index, user), password_hash in zip(pending, hashes):
+            batch.append((index, {'username': user['username'], 'email': user['email'],
+                                  'password': password_hash}))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+    report['errors'].sort(key=lambda error: error['index'])
+    return report
+
+
+def _read_users(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@users_cli.command('provision')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', type=int, help='Defaults to PROVISION_BATCH_SIZE.')
+@click.option('--workers', type=int, help='Hashing threads; defaults to PROVISION_WORKERS or the CPU count.')
+def provision_command(path, batch_size, workers):
+    """Create the users listed in a CSV or NDJSON file (username, email, password)."""
+    records = _read_users(path)
+
+    def progress(report):
+        click.echo(f"{report['created'] + report['failed']}/{report['total']} processed, "
+                   f"{report['created']} created, {report['users_per_second']} users/s")
+
+    report = provision_users(records, batch_size or current_app.config['PROVISION_BATCH_SIZE'],
+                             workers or current_app.config['PROVISION_WORKERS'], progress)
+    for error in report['errors']:
+        click.echo(f"#{error['index']} {error['email']}: {error['error']}", err=True)
+    click.echo(f"Created {report['created']} of {report['total']} users in {report['elapsed_seconds']}s")
@@ -0,0 +1,145 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# GCRA (generic cell rate algorithm): each key stores a single float, its
+# theoretical arrival time (TAT). A limit of `count` per `period` seconds
+# spaces requests `period / count` apart and allows a burst of `count`.
+
+
+def gcra(tat, now, count, period):
+    # Returns (new TAT, seconds until retry); the request is allowed when the
+    # retry delay is 0.
+    interval = period / count
+    tat = max(tat or 0.0, now)
+    allow_at = tat + interval - period
+    if now < allow_at:
+        return None, allow_at - now
+    return tat + interval, 0
+
+
+class MemoryStore:
+    # Per-process stand-in: a dict of key -> TAT.
+
+    def __init__(self, max_keys=100000):
+        self._lock = threading.Lock()
+        self._tats = {}
+        self.max_keys = max_keys
+
+    def hit(self, key, count, period):
+        now = time.time()
+        with self._lock:
+            tat, retry_after = gcra(self._tats.get(key), now, count, period)
+            if tat is not None:
+                self._tats[key] = tat
+                if len(self._tats) > self.max_keys:
+                    # Keys whose TAT has passed are at a full burst allowance,
+                    # the same as absent ones.
+                    self._tats = {k: v for k, v in self._tats.items() if v > now}
+            return retry_after
+
+
+class SharedMemoryStore:
+    # One table for every worker on the host: a file (ideally on /dev/shm) of
+    # fixed 16-byte slots, (u64 key hash, f64 TAT), addressed by open hashing.
+    # Each update holds an exclusive flock on the file, which excludes other
+    # processes, and a thread lock, since the flock is per descriptor and
+    # every thread of a worker shares the one descriptor.
+    SLOT = struct.Struct('<Qd')
+    PROBES = 8
+
+    def __init__(self, path, slots):
+        if fcntl is None:
+            raise RuntimeError("RATE_LIMIT_STORE = 'shared' requires fcntl (not available on Windows)")
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._fd = None
+        self._mmap = None
+        self._pid = None
+
+    def _open(self):
+        # Reopened after fork so each worker has its own descriptor and lock.
+        if self._pid == os.getpid():
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.slots * self.SLOT.size
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._fd = fd
+        self._mmap = mmap.mmap(fd, size)
+        self._pid = os.getpid()
+
+    def hit(self, key, count, period):
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        with self._lock:
+            self._open()
+            return self._hit(digest, time.time(), count, period)
+
+    def _hit(self, digest, now, count, period):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # Probe for the key; remember the stalest slot in case it is absent.
+            slot, stored = None, None
+            victim, victim_tat = None, None
+            for probe in range(self.PROBES):
+                index = (digest + probe) % self.slots
+                slot_hash, tat = self.SLOT.unpack_from(self._mmap, index * self.SLOT.size)
+                if slot_hash == digest:
+                    slot, stored = index, tat
+                    break
+                if victim is None or slot_hash == 0 or tat < victim_tat:
+                    victim, victim_tat = index, (float('-inf') if slot_hash == 0 else tat)
+            if slot is None:
+                slot = victim
+
+            tat, retry_after = gcra(stored, now, count, period)
+            if tat is not None:
+                self.SLOT.pack_into(self._mmap, slot * self.SLOT.size, digest, tat)
+            return retry_after
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class LoginRateLimiter:
+    def __init__(self):
+        self.store = None
+        self.limits = {}
+
+    def init_app(self, app):
+        if app.config['RATE_LIMIT_STORE'] == 'shared':
+            self.store = SharedMemoryStore(app.config['RATE_LIMIT_SHM_PATH'], app.config['RATE_LIMIT_SLOTS'])
+        else:
+            self.store = MemoryStore()
+        self.limits = {'ip': app.config['LOGIN_RATE_LIMIT_IP'], 'email': app.config['LOGIN_RATE_LIMIT_EMAIL']}
+
+    def check(self, ip, email):
+        # Returns 0 if the attempt may proceed, otherwise seconds to wait. Only
+        # a few hashes and a dict or mmap lookup: no DB, no bcrypt.
+        if self.store is None:
+            return 0
+        for scope, value in (('ip', ip), ('email', email)):
+            limit = self.limits.get(scope)
+            if not limit or not value:
+                continue
+            count, period = limit
+            retry_after = self.store.hit(f'login:{scope}:{value}', count, period)
+            if retry_after:
+                return retry_after
+        return 0
+
+
+login_limiter = LoginRateLimiter()
+
+
+def normalize_email(email):
+    return email.strip().lower() if isinstance(email, str) else None
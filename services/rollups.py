@@ -0,0 +1,203 @@
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case
+from models import db
+from models.order import Order
+from models.order_rollup import OrderDailyRollup, RollupWatermark
+from models.order_summary import UserOrderSummary
+from models.product import Product
+from services.sql import dialect_insert, lock_schema
+
+WATERMARK = 'order_daily_rollup'
+
+rollups_cli = AppGroup('rollups', help='Maintain the order analytics rollup tables.')
+
+
+def _apply(deltas):
+    # deltas: {(day, product_id, status): [order_count, units, revenue]}
+    # Rows are upserted in key order, so two transactions touching the same
+    # rows lock them in the same order and cannot deadlock.
+    if not deltas:
+        return
+    insert = dialect_insert(OrderDailyRollup).values([
+        {'day': day, 'product_id': product_id, 'status': status,
+         'order_count': order_count, 'units': units, 'revenue': revenue}
+        for (day, product_id, status), (order_count, units, revenue) in sorted(deltas.items())
+    ])
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['day', 'product_id', 'status'],
+        set_={
+            'order_count': OrderDailyRollup.order_count + insert.excluded.order_count,
+            'units': OrderDailyRollup.units + insert.excluded.units,
+            'revenue': OrderDailyRollup.revenue + insert.excluded.revenue,
+        },
+    ))
+
+
+def _add(deltas, day, product_id, status, quantity, price, sign=1):
+    bucket = deltas.setdefault((day, product_id, status), [0, 0, 0.0])
+    bucket[0] += sign
+    bucket[1] += sign * quantity
+    bucket[2] += sign * quantity * price
+
+
+def record_orders(orders, prices):
+    # Called inside the transaction that inserts the orders (after a flush, so
+    # date_created is populated); a no-op when compaction owns the rollups.
+    if current_app.config['ROLLUP_MODE'] != 'inline':
+        return
+    deltas = {}
+    for order in orders:
+        _add(deltas, order.date_created.date(), order.product_id, order.status, order.quantity, prices[order.product_id])
+    _apply(deltas)
+
+
+def record_status_change(order, old_status, price):
+    # For status update paths: moves the order between status buckets in the
+    # same transaction as the update.
+    if current_app.config['ROLLUP_MODE'] != 'inline' or old_status == order.status:
+        return
+    deltas = {}
+    day = order.date_created.date()
+    _add(deltas, day, order.product_id, old_status, order.quantity, price, sign=-1)
+    _add(deltas, day, order.product_id, order.status, order.quantity, price)
+    _apply(deltas)
+
+
+def record_user_summary(user_id, orders):
+    # Always maintained in the order transaction: one upsert per add_orders call.
+    insert = dialect_insert(UserOrderSummary).values(
+        user_id=user_id,
+        order_count=len(orders),
+        lifetime_units=sum(order.quantity for order in orders),
+        last_order_at=max(order.date_created for order in orders),
+    )
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={
+            'order_count': UserOrderSummary.order_count + insert.excluded.order_count,
+            'lifetime_units': UserOrderSummary.lifetime_units + insert.excluded.lifetime_units,
+            'last_order_at': case(
+                (UserOrderSummary.last_order_at > insert.excluded.last_order_at, UserOrderSummary.last_order_at),
+                else_=insert.excluded.last_order_at,
+            ),
+        },
+    ))
+
+
+def compact(batch_size, lag_seconds):
+    # Folds orders past the watermark into the rollups in id order. Orders
+    # younger than the lag are left for the next run so transactions that
+    # allocated an id but have not committed yet are not skipped.
+    #
+    # Orders counted inline are not behind any watermark, so compaction only
+    # runs in deferred mode and only from a watermark set by a deferred-mode
+    # rebuild; inline mode discards the watermark (see init_rollups).
+    if current_app.config['ROLLUP_MODE'] == 'inline':
+        raise RuntimeError("ROLLUP_MODE is 'inline': orders are already folded into the rollups as they are placed")
+    folded = 0
+    while True:
+        watermark = db.session.get(RollupWatermark, WATERMARK, with_for_update=True)
+        if watermark is None:
+            db.session.rollback()
+            raise RuntimeError('No compaction watermark: after switching ROLLUP_MODE to deferred, '
+                               'run `flask rollups rebuild` once before compacting')
+
+        cutoff = datetime.utcnow() - timedelta(seconds=lag_seconds)
+        rows = (db.session.query(Order.id, Order.date_created, Order.product_id, Order.status, Order.quantity, Product.price)
+                .join(Product, Product.id == Order.product_id)
+                .filter(Order.id > watermark.last_order_id, Order.date_created < cutoff)
+                .order_by(Order.id).limit(batch_size).all())
+        if not rows:
+            db.session.commit()
+            return folded
+
+        deltas = {}
+        for order_id, date_created, product_id, status, quantity, price in rows:
+            _add(deltas, date_created.date(), product_id, status, quantity, price)
+        _apply(deltas)
+        watermark.last_order_id = rows[-1].id
+        db.session.commit()
+        folded += len(rows)
+
+
+def rebuild():
+    db.session.query(OrderDailyRollup).delete()
+    last_order_id = db.session.query(db.func.max(Order.id)).scalar() or 0
+    rows = (db.session.query(Order.date_created, Order.product_id, Order.status, Order.quantity, Product.price)
+            .join(Product, Product.id == Order.product_id)
+            .filter(Order.id <= last_order_id).yield_per(10000))
+    deltas = {}
+    for date_created, product_id, status, quantity, price in rows:
+        _add(deltas, date_created.date(), product_id, status, quantity, price)
+    items = list(deltas.items())
+    for start in range(0, len(items), 1000):
+        _apply(dict(items[start:start + 1000]))
+    _reset_watermark(last_order_id if current_app.config['ROLLUP_MODE'] != 'inline' else None)
+
+    db.session.query(UserOrderSummary).delete()
+    db.session.execute(_summaries_from_orders())
+    db.session.commit()
+
+
+def _summaries_from_orders():
+    return UserOrderSummary.__table__.insert().from_select(
+        ['user_id', 'order_count', 'lifetime_units', 'last_order_at'],
+        db.select(Order.user_id, db.func.count(Order.id), db.func.sum(Order.quantity), db.func.max(Order.date_created))
+        .group_by(Order.user_id),
+    )
+
+
+def backfill_user_summaries():
+    # user_order_summary is only maintained for orders placed since it was
+    # added; the first worker to boot after that fills it in from the order
+    # table. Returns whether it did.
+    with db.engine.begin() as conn:
+        lock_schema(conn)
+        if conn.execute(db.select(UserOrderSummary.user_id).limit(1)).first() is not None:
+            return False
+        conn.execute(_summaries_from_orders())
+        return True
+
+
+def _reset_watermark(last_order_id):
+    # None removes the watermark, so compaction refuses to run until a
+    # deferred-mode rebuild sets it again.
+    watermark = db.session.get(RollupWatermark, WATERMARK)
+    if last_order_id is None:
+        if watermark is not None:
+            db.session.delete(watermark)
+        return
+    watermark = watermark or RollupWatermark(name=WATERMARK)
+    watermark.last_order_id = last_order_id
+    db.session.add(watermark)
+
+
+def init_rollups(app):
+    # Inline mode leaves no watermark behind: if the app later switches to
+    # deferred, compacting from a stale one would count the orders folded
+    # inline since then a second time.
+    if app.config['ROLLUP_MODE'] == 'inline':
+        _reset_watermark(None)
+        db.session.commit()
+    backfill_user_summaries()
+
+
+@rollups_cli.command('compact')
+@click.option('--batch-size', default=5000, show_default=True)
+def compact_command(batch_size):
+    """Fold new orders into the rollups (ROLLUP_MODE = 'deferred')."""
+    try:
+        folded = compact(batch_size, current_app.config['ROLLUP_COMPACTION_LAG'])
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Folded {folded} orders into {OrderDailyRollup.__tablename__}')
+
+
+@rollups_cli.command('rebuild')
+def rebuild_command():
+    """Recompute the rollups and user summaries from the order table."""
+    rebuild()
+    click.echo(f'Rebuilt {OrderDailyRollup.__tablename__} and {UserOrderSummary.__tablename__}')
@@ -0,0 +1,103 @@
+import base64
+import json
+from sqlalchemy import Double, cast, column, func, literal_column, select, table, text, tuple_
+from models import db
+from models.product import Product
+from services.sql import lock_schema
+
+# Postgres: a weighted tsvector generated from name (A) and description (B),
+# so name matches rank above description-only matches.
+POSTGRES_DDL = [
+    """ALTER TABLE product ADD COLUMN IF NOT EXISTS search_vector tsvector
+       GENERATED ALWAYS AS (
+           setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce(description, '')), 'B')
+       ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_product_search_vector ON product USING GIN (search_vector)",
+]
+
+# SQLite: an external-content FTS5 table over product, kept in sync by triggers.
+# Every statement is idempotent, so workers booting together may both run them.
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(name, description, content='product', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+           INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+           INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE ON product BEGIN
+           INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+           INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+       END""",
+    "INSERT INTO product_fts(product_fts) VALUES ('rebuild')",
+]
+
+
+def init_search():
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as conn:
+        if dialect == 'postgresql':
+            lock_schema(conn)
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+        elif dialect == 'sqlite':
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'product_fts'")).first()
+            if not exists:
+                for statement in SQLITE_DDL:
+                    conn.execute(text(statement))
+
+
+def encode_cursor(rank, product_id):
+    return base64.urlsafe_b64encode(json.dumps([rank, product_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        rank, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(product_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def _fts5_query(q):
+    # Quote every term so user input is never parsed as FTS5 query syntax.
+    terms = q.split()
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def search_products(q, product_columns, limit, cursor=None):
+    # Returns (rows, next_cursor); rows are ordered best match first.
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        query = func.websearch_to_tsquery('english', q)
+        search_vector = literal_column('product.search_vector')
+        # ts_rank: higher is better, so page downwards. It returns real; the
+        # cursor's rank comes back as a double, so compare (and order) in
+        # double precision, where the widened value round-trips exactly.
+        rank = cast(func.ts_rank(search_vector, query), Double)
+        stmt = select(*product_columns, rank.label('rank')).where(search_vector.op('@@')(query))
+        if cursor:
+            stmt = stmt.where(tuple_(rank, Product.id) < tuple_(*decode_cursor(cursor)))
+        stmt = stmt.order_by(rank.desc(), Product.id.desc())
+    elif dialect == 'sqlite':
+        fts = table('product_fts', column('rowid'))
+        # bm25: lower is better, so page upwards.
+        rank = func.bm25(literal_column('product_fts'))
+        stmt = (select(*product_columns, rank.label('rank'))
+                .select_from(Product)
+                .join(fts, fts.c.rowid == Product.id)
+                .where(literal_column('product_fts').op('MATCH')(_fts5_query(q))))
+        if cursor:
+            stmt = stmt.where(tuple_(rank, Product.id) > tuple_(*decode_cursor(cursor)))
+        stmt = stmt.order_by(rank, Product.id)
+    else:
+        raise NotImplementedError(f'Full-text search is not supported on {dialect}')
+
+    stmt = stmt.add_columns(Product.id.label('cursor_id')).limit(limit + 1)
+    rows = db.session.execute(stmt).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].rank, rows[-1].cursor_id)
+    return rows, next_cursor
@@ -0,0 +1,22 @@
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db
+
+
+def dialect_insert(model):
+    # INSERT ... ON CONFLICT is dialect-specific in SQLAlchemy; both backends
+    # we run on (Postgres in production, SQLite in dev) support it.
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+SCHEMA_LOCK_ID = 734003
+
+
+def lock_schema(conn):
+    # Startup DDL runs in every worker as it boots. On Postgres they take
+    # turns on an advisory lock, held until the transaction ends, so two
+    # workers never both find an object missing and both create it.
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': SCHEMA_LOCK_ID})
@@ -0,0 +1,144 @@
+import bisect
+import heapq
+import os
+import threading
+import unicodedata
+from sqlalchemy import func
+from models import db
+from models.order_rollup import OrderDailyRollup
+from models.product import Product
+from services.cache_bus import cache_bus
+
+
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+class SuggestIndex:
+    # Sorted array of (normalized name, product id) searched with bisect, plus
+    # precomputed top-k lists for short prefixes, whose ranges are too wide to
+    # scan per keystroke. Popularity (units ordered) only ever grows, so the
+    # short-prefix lists can be maintained incrementally.
+    #
+    # This worker's products and orders are applied in place. Other workers'
+    # arrive through a rebuild from the DB on a background thread, after a
+    # remote catalog change and every SUGGEST_REFRESH_INTERVAL seconds (which
+    # also reconciles popularity); lookups use the current index meanwhile.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._products = {}
+        self._top = {}
+        self.max_k = 10
+        self.short_prefix_len = 2
+        self._app = None
+        self._wanted = threading.Event()
+        self._builder_pid = None
+        self._builder_lock = threading.Lock()
+
+    def build(self, rows, max_k, short_prefix_len):
+        # rows: iterable of (product_id, name, popularity)
+        products = {product_id: [name, popularity or 0] for product_id, name, popularity in rows}
+        entries = sorted((normalize(name), product_id) for product_id, (name, _) in products.items())
+        with self._lock:
+            self.max_k = max_k
+            self.short_prefix_len = short_prefix_len
+            self._products = products
+            self._entries = entries
+            self._top = {}
+            for key, product_id in entries:
+                for prefix in self._short_prefixes(key):
+                    self._offer(prefix, product_id)
+
+    def _short_prefixes(self, key):
+        return [key[:n] for n in range(1, min(len(key), self.short_prefix_len) + 1)]
+
+    def _rank(self, product_id):
+        return (self._products[product_id][1], -product_id)
+
+    def _offer(self, prefix, product_id):
+        top = self._top.setdefault(prefix, [])
+        if product_id not in top:
+            top.append(product_id)
+        top.sort(key=self._rank, reverse=True)
+        del top[self.max_k:]
+
+    def mark_stale(self, key=None, data=None):
+        self._ensure_builder()
+        self._wanted.set()
+
+    def _ensure_builder(self):
+        # Threads do not survive fork, so each worker starts its own.
+        if self._app is None or self._builder_pid == os.getpid():
+            return
+        with self._builder_lock:
+            if self._builder_pid == os.getpid():
+                return
+            self._builder_pid = os.getpid()
+        threading.Thread(target=self._build_loop, name='suggest-builder', daemon=True).start()
+
+    def _build_loop(self):
+        while True:
+            self._wanted.wait(self._app.config['SUGGEST_REFRESH_INTERVAL'])
+            self._wanted.clear()
+            try:
+                with self._app.app_context():
+                    load_suggest_index(self._app)
+            except Exception:
+                self._app.logger.exception('Suggest index rebuild failed')
+
+    def add(self, product_id, name, popularity=0):
+        key = normalize(name)
+        with self._lock:
+            if product_id in self._products:
+                return
+            self._products[product_id] = [name, popularity]
+            bisect.insort(self._entries, (key, product_id))
+            for prefix in self._short_prefixes(key):
+                self._offer(prefix, product_id)
+
+    def bump(self, product_id, amount):
+        with self._lock:
+            product = self._products.get(product_id)
+            if product is None:
+                return
+            product[1] += amount
+            for prefix in self._short_prefixes(normalize(product[0])):
+                self._offer(prefix, product_id)
+
+    def suggest(self, prefix, k):
+        self._ensure_builder()
+        prefix = normalize(prefix)
+        k = max(1, min(k, self.max_k))
+        with self._lock:
+            if len(prefix) <= self.short_prefix_len:
+                ids = self._top.get(prefix, [])[:k]
+            else:
+                lo = bisect.bisect_left(self._entries, (prefix,))
+                hi = bisect.bisect_left(self._entries, (prefix + '\U0010ffff',))
+                ids = heapq.nlargest(k, (product_id for _, product_id in self._entries[lo:hi]), key=self._rank)
+            return [{'id': product_id, 'name': self._products[product_id][0]} for product_id in ids]
+
+
+suggest_index = SuggestIndex()
+
+
+def load_suggest_index(app):
+    # Popularity comes from the daily rollups, which grow with days x
+    # products rather than with every order ever placed. In deferred rollup
+    # mode it trails by up to a compaction; this worker's own orders are
+    # still bumped in place.
+    units = (db.session.query(OrderDailyRollup.product_id, func.sum(OrderDailyRollup.units).label('units'))
+             .group_by(OrderDailyRollup.product_id).subquery())
+    rows = (db.session.query(Product.id, Product.name, units.c.units)
+            .outerjoin(units, units.c.product_id == Product.id).all())
+    suggest_index.build(rows, app.config['SUGGEST_MAX_K'], app.config['SUGGEST_SHORT_PREFIX_LEN'])
+
+
+def init_suggest(app):
+    suggest_index._app = app
+    load_suggest_index(app)
+    # This worker's own additions are applied in place by add_product.
+    cache_bus.subscribe('products', suggest_index.mark_stale, remote_only=True)
@@ -0,0 +1,65 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, func, select, tuple_
+from models import db
+from models.user import User
+
+
+def encode_cursor(date_created, user_id):
+    return base64.urlsafe_b64encode(json.dumps([date_created.isoformat(), user_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        date_created, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(date_created), int(user_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def _email_prefix(prefix):
+    key = func.lower(User.email)
+    prefix = prefix.lower()
+    if db.engine.dialect.name == 'postgresql':
+        # Served by the varchar_pattern_ops index on lower(email).
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return key.like(escaped + '%', escape='\\')
+    # SQLite compares bytewise, so a prefix is an exact range on
+    # ix_user_email_lower.
+    return and_(key >= prefix, key < prefix + '\U0010ffff')
+
+
+def list_users(user_columns, limit, cursor=None, created_after=None, created_before=None, email_prefix=None):
+    # Returns (rows, next_cursor), oldest first. Keyset pagination on
+    # (date_created, id) walks ix_user_date_created_id, so every page costs
+    # the same however deep it is.
+    stmt = select(*user_columns)
+    if created_after:
+        stmt = stmt.where(User.date_created >= created_after)
+    if created_before:
+        stmt = stmt.where(User.date_created < created_before)
+    if email_prefix:
+        stmt = stmt.where(_email_prefix(email_prefix))
+    if cursor:
+        stmt = stmt.where(tuple_(User.date_created, User.id) > tuple_(*decode_cursor(cursor)))
+
+    stmt = (stmt.add_columns(User.date_created.label('cursor_created'), User.id.label('cursor_id'))
+            .order_by(User.date_created, User.id).limit(limit + 1))
+    rows = db.session.execute(stmt).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].cursor_created, rows[-1].cursor_id)
+    return rows, next_cursor
+
+
+def iter_user_pages(user_columns, page_size, **filters):
+    # Every matching user, one keyset page in memory at a time.
+    cursor = None
+    while True:
+        rows, cursor = list_users(user_columns, page_size, cursor, **filters)
+        if rows:
+            yield rows
+        if not cursor:
+            return
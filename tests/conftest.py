@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+# app.py builds the app from Config at import time, so point it at a scratch
+# SQLite database, with cheap bcrypt, before anything imports it.
+config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+config.Config.BCRYPT_LOG_ROUNDS = 4
+# Every test client logs in from 127.0.0.1.
+config.Config.LOGIN_RATE_LIMIT_IP = None
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def register(client):
+    def register(email, password='secret'):
+        response = client.post('/users/register', json={
+            'username': 'user', 'email': email, 'password': password, 'confirm_password': password,
+        })
+        assert response.status_code == 201
+        return response.get_json()
+    return register
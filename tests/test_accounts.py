@@ -0,0 +1,84 @@
+import asyncio
+import json
+import pytest
+
+
+def login(client, email, password='secret'):
+    return client.post('/users/login', json={'email': email, 'password': password})
+
+
+def test_email_is_unique_regardless_of_case(client, register):
+    register('Casey@Example.com')
+    response = client.post('/users/register', json={
+        'username': 'user', 'email': 'CASEY@example.com', 'password': 'secret', 'confirm_password': 'secret',
+    })
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('registered, email', [
+    ('Mixed.Case@Example.com', 'mixed.case@example.com'),
+    ('upper.case@example.com', 'UPPER.CASE@EXAMPLE.COM'),
+    ('Same.Case@Example.com', 'Same.Case@Example.com'),
+])
+def test_login_ignores_email_case(client, register, registered, email):
+    register(registered)
+    response = login(client, email)
+    assert response.status_code == 200
+    assert response.get_json()['user']['email'] == registered
+
+
+def test_login_rejects_a_wrong_password(client, register):
+    register('wrong-password@example.com')
+    assert login(client, 'Wrong-Password@example.com', 'not it').status_code == 401
+
+
+def test_async_login_ignores_email_case(app, register, monkeypatch):
+    pytest.importorskip('aiosqlite')
+    from controllers.async_api import AsyncRequest, login as async_login
+    from services.async_db import dispose_async_db, init_async_db
+
+    register('Async.Case@Example.com')
+    monkeypatch.setitem(app.config, 'ASYNC_SQLALCHEMY_DATABASE_URI',
+                        app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite://', 'sqlite+aiosqlite://', 1))
+    monkeypatch.setitem(app.config, 'ASYNC_ENGINE_OPTIONS', {})
+    body = json.dumps({'email': 'async.case@EXAMPLE.com', 'password': 'secret'}).encode()
+    request = AsyncRequest({'method': 'POST', 'path': '/users/login', 'query_string': b'', 'headers': []}, body)
+
+    async def run():
+        init_async_db(app)
+        try:
+            return await async_login(app, request)
+        finally:
+            await dispose_async_db(app)
+
+    body, status = asyncio.run(run())
+    assert status == 200
+    assert body['user']['email'] == 'Async.Case@Example.com'
+
+
+def test_needs_rehash_follows_the_configured_policy(app, monkeypatch):
+    from services import passwords
+    current = passwords.hash_password('secret')
+    assert current.startswith(f"${app.config['BCRYPT_HASH_PREFIX']}$")
+    assert not passwords.needs_rehash(current)
+    assert passwords.needs_rehash(current.replace('$2b$', '$2a$', 1))
+    assert passwords.needs_rehash('not a bcrypt hash')
+    monkeypatch.setattr(passwords, '_hash_policy', ('2b', app.config['BCRYPT_LOG_ROUNDS'] + 1))
+    assert passwords.needs_rehash(current)
+    monkeypatch.setattr(passwords, '_hash_policy', ('2b', app.config['BCRYPT_LOG_ROUNDS'] - 1))
+    assert not passwords.needs_rehash(current)
+
+
+def test_confirm_password_is_relaxed_on_old_sqlite_databases(tmp_path):
+    from sqlalchemy import create_engine, inspect, text
+    from services.accounts import _relax_confirm_password
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE "user" (id INTEGER PRIMARY KEY, confirm_password VARCHAR(120) NOT NULL)'))
+        conn.execute(text('''INSERT INTO "user" (id, confirm_password) VALUES (1, 'copy of the hash')'''))
+        _relax_confirm_password(conn)
+    with engine.connect() as conn:
+        columns = {c['name']: c for c in inspect(conn).get_columns('user')}
+        assert columns['confirm_password']['nullable']
+        conn.execute(text('INSERT INTO "user" (id) VALUES (2)'))
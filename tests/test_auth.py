@@ -0,0 +1,49 @@
+import pytest
+import services.auth
+from services.auth import parse_bearer
+
+
+@pytest.mark.parametrize('header, token', [
+    ('Bearer abc.def.ghi', 'abc.def.ghi'),
+    ('bearer abc.def.ghi', 'abc.def.ghi'),
+    ('Bearer', None),
+    ('Bearer ', None),
+    ('abc.def.ghi', None),
+    ('Basic dXNlcjpwYXNz', None),
+    ('Bearer abc def', None),
+])
+def test_parse_bearer(header, token):
+    assert parse_bearer(header) == token
+
+
+def test_malformed_header_is_a_401(client):
+    response = client.get('/orders/', headers={'Authorization': 'abc.def.ghi'})
+    assert response.status_code == 401
+    assert 'Malformed' in response.get_json()['message']
+
+
+def test_missing_and_invalid_tokens_are_401(client):
+    assert client.get('/orders/').status_code == 401
+    assert client.get('/orders/', headers={'Authorization': 'Bearer abc.def.ghi'}).status_code == 401
+
+
+def test_server_timing_reports_auth(client, register):
+    token = register('timing@example.com')['access_token']
+    response = client.get('/orders/', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.headers['Server-Timing'].startswith('auth;dur=')
+    assert 'Server-Timing' not in client.get('/products/').headers
+
+
+def test_batch_verifies_the_token_once(client, register, monkeypatch):
+    token = register('batch-auth@example.com')['access_token']
+    calls = []
+    verify_token = services.auth.verify_token
+    monkeypatch.setattr(services.auth, 'verify_token', lambda t: calls.append(t) or verify_token(t))
+
+    response = client.post('/batch', headers={'Authorization': f'Bearer {token}'}, json=[
+        {'path': '/orders/'}, {'path': '/orders/'}, {'path': '/users/protected'},
+    ])
+    assert response.status_code == 200
+    assert [result['status'] for result in response.get_json()] == [200, 200, 200]
+    assert calls == [token]
@@ -0,0 +1,47 @@
+import itertools
+import pytest
+
+users = itertools.count()
+
+
+@pytest.fixture
+def auth(client, register):
+    token = register(f'batch-{next(users)}@example.com')['access_token']
+    client.post('/products/add', json={'name': 'Batch widget', 'description': 'For batches', 'price': 3})
+    return {'Authorization': f'Bearer {token}'}
+
+
+def product_id(client):
+    return next(product['id'] for product in client.get('/products/').get_json() if product['name'] == 'Batch widget')
+
+
+def test_failed_write_does_not_break_later_sub_requests(client, auth):
+    widget = product_id(client)
+    response = client.post('/batch', headers=auth, json=[
+        # Not a bindable value: fails in the flush, not as an IntegrityError.
+        {'method': 'POST', 'path': '/orders/add', 'body': [{'product_id': widget, 'quantity': {'units': 1}}]},
+        {'path': '/orders/'},
+        {'method': 'POST', 'path': '/orders/add', 'body': [{'product_id': widget, 'quantity': 2}]},
+        {'path': '/orders/summary'},
+    ])
+    statuses = [result['status'] for result in response.get_json()]
+    assert statuses == [500, 200, 201, 200]
+    assert response.get_json()[1]['body'] == []
+    assert response.get_json()[3]['body']['order_count'] == 1
+
+
+def test_sub_requests_run_in_order(client, auth):
+    widget = product_id(client)
+    response = client.post('/batch', headers=auth, json=[
+        {'method': 'POST', 'path': '/orders/add', 'body': [{'product_id': widget, 'quantity': 1}]},
+        {'path': '/orders/'},
+        {'path': '/orders/summary'},
+    ])
+    results = response.get_json()
+    assert [result['status'] for result in results] == [201, 200, 200]
+    assert len(results[1]['body']) == 1
+
+
+@pytest.mark.parametrize('body', [{}, [{'path': 'orders'}], [{'path': '/batch'}], [{'method': 'GET'}]])
+def test_invalid_batches_are_rejected(client, body):
+    assert client.post('/batch', json=body).status_code == 400
@@ -0,0 +1,126 @@
+import json
+import os
+import pytest
+from sqlalchemy import select
+from models import db
+from models.cache_version import CacheVersion
+from services.cache_bus import MAX_DATA_BYTES, cache_bus
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, key, data):
+        self.calls.append((key, data))
+
+
+@pytest.fixture
+def bus(app_context, request):
+    # A key of its own per test, with one ordinary and one remote_only subscriber.
+    key = 'test-' + request.node.name
+    local, remote = Recorder(), Recorder()
+    cache_bus.subscribe(key, local)
+    cache_bus.subscribe(key, remote, remote_only=True)
+    return key, local, remote
+
+
+def commit(key, data=None):
+    cache_bus.invalidate(key, data=data)
+    db.session.commit()
+
+
+def version(key):
+    # Read on a connection of its own, leaving the session's transaction alone.
+    with db.engine.connect() as conn:
+        return conn.execute(select(CacheVersion.version).where(CacheVersion.key == key)).scalar() or 0
+
+
+def other_worker_commits(key, data=None):
+    # Another worker's commit: its version is bumped, and the message that
+    # announces it is returned still in transit.
+    with db.engine.begin() as conn:
+        bumped = cache_bus._bump(conn, key, 1)
+    return json.dumps({'pid': os.getpid() + 1, 'key': key, 'version': bumped, 'data': data})
+
+
+def test_own_commit_skips_remote_only_subscribers(bus):
+    key, local, remote = bus
+    commit(key, ['a'])
+    commit(key, ['b'])
+    assert local.calls == [(key, ['a']), (key, ['b'])]
+    assert remote.calls == []
+    assert version(key) == 2
+
+
+def test_version_is_bumped_after_commit_not_in_the_transaction(bus):
+    key, local, remote = bus
+    cache_bus.invalidate(key)
+    assert version(key) == 0
+    db.session.commit()
+    assert version(key) == 1
+
+
+def test_rollback_discards_pending_invalidations(bus):
+    key, local, remote = bus
+    cache_bus.invalidate(key)
+    db.session.rollback()
+    db.session.commit()
+    assert version(key) == 0
+    assert local.calls == []
+
+
+def test_remote_messages_in_order_carry_their_data(bus):
+    key, local, remote = bus
+    first, second = other_worker_commits(key, ['a']), other_worker_commits(key, ['b'])
+    cache_bus._receive(first)
+    cache_bus._receive(second)
+    cache_bus._receive(first)
+    assert remote.calls == [(key, ['a']), (key, ['b'])]
+    assert local.calls == remote.calls
+
+
+def test_remote_gap_asks_for_a_full_refresh(bus):
+    key, local, remote = bus
+    other_worker_commits(key, ['lost'])
+    cache_bus._receive(other_worker_commits(key, ['b']))
+    assert remote.calls == [(key, None)]
+
+
+def test_own_commit_after_an_undelivered_remote_one(bus):
+    # B commits v1, then A commits v2 before B's message arrives. A must not
+    # treat v1 as seen: its remote_only subscribers refresh in full.
+    key, local, remote = bus
+    in_transit = other_worker_commits(key, ['from-b'])
+    commit(key, ['from-a'])
+    assert remote.calls == [(key, None)]
+    assert local.calls == [(key, None)]
+
+    cache_bus._receive(in_transit)
+    commit(key, ['again'])
+    assert remote.calls == [(key, None)]
+    assert local.calls[-1] == (key, ['again'])
+
+
+def test_invalidation_without_data_wins_within_a_transaction(bus):
+    key, local, remote = bus
+    cache_bus.invalidate(key, data=['a'])
+    cache_bus.invalidate(key)
+    cache_bus.invalidate(key, data=['b'])
+    db.session.commit()
+    assert local.calls == [(key, None)]
+
+
+def test_long_data_is_split_into_consecutive_versions(bus):
+    key, local, remote = bus
+    emails = [f'user{i}@example.com' for i in range(1000)]
+    commit(key, emails)
+    chunks = cache_bus._chunks(emails)
+    assert len(chunks) > 1
+    assert version(key) == len(chunks)
+    assert local.calls == [(key, emails)]
+
+    messages = [json.loads(message) for message in cache_bus._messages(key, len(chunks), chunks)]
+    assert [message['version'] for message in messages] == list(range(1, len(chunks) + 1))
+    assert [email for message in messages for email in message['data']] == emails
+    assert all(len(json.dumps(message['data'])) <= MAX_DATA_BYTES for message in messages)
@@ -0,0 +1,62 @@
+import pytest
+from models import db
+from models.product import Product
+from services.cache_bus import cache_bus
+from services.catalog_store import CatalogSnapshot, CatalogStore, build_catalog
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'catalog')
+
+
+@pytest.fixture
+def undated(app_context):
+    product = Product(name='Undated', description='No date_added', price=4)
+    db.session.add(product)
+    db.session.flush()
+    # The column default would fill in an explicit None on insert.
+    db.session.execute(db.update(Product).where(Product.id == product.id).values(date_added=None))
+    db.session.commit()
+    return product.id
+
+
+def test_snapshot_matches_the_product_table(app_context, path, undated):
+    assert build_catalog(path)
+    snapshot = CatalogSnapshot(path)
+    products = db.session.query(Product).order_by(Product.id).all()
+    assert snapshot.count == len(products)
+    assert [row['id'] for row in snapshot.rows(['id'])] == [product.id for product in products]
+    product = products[-1]
+    assert snapshot.get(product.id) == {
+        'id': product.id, 'name': product.name, 'description': product.description,
+        'price': product.price, 'date_added': product.date_added and product.date_added.isoformat(),
+    }
+    assert snapshot.get(-1) is None
+
+
+def test_null_date_added_is_written_as_null(app, app_context, path, undated):
+    assert build_catalog(path)
+    snapshot = CatalogSnapshot(path)
+    assert snapshot.get(undated)['date_added'] is None
+    assert snapshot.get(undated, ['name'])['name'] == 'Undated'
+    body = app.json.loads(bytes(snapshot.variants()['identity']))
+    assert next(row for row in body if row['id'] == undated)['date_added'] is None
+
+
+def test_build_is_a_no_op_while_current(app_context, path):
+    assert build_catalog(path)
+    assert not build_catalog(path)
+
+
+def test_startup_replaces_a_stale_snapshot(app, app_context, path, monkeypatch):
+    build_catalog(path)
+    built = CatalogSnapshot(path).source_version
+    cache_bus.invalidate('products')
+    db.session.commit()
+
+    monkeypatch.setitem(app.config, 'CATALOG_STORE_PATH', path)
+    monkeypatch.setattr(cache_bus, 'subscribe', lambda *args, **kwargs: None)
+    store = CatalogStore()
+    store.init_app(app)
+    assert store.snapshot().source_version > built
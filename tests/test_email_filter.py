@@ -0,0 +1,80 @@
+import json
+import os
+import time
+import pytest
+from models import db
+from models.user import User
+from services.cache_bus import cache_bus
+from services.email_filter import BloomFilter, registered_emails
+from services.passwords import hash_password
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    emails = [f'user{i}@example.com' for i in range(1000)]
+    for email in emails:
+        bloom.add(email)
+    assert all(email in bloom for email in emails)
+    false_positives = sum(f'other{i}@example.com' in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def register(client, email):
+    response = client.post('/users/register', json={
+        'username': 'user', 'email': email, 'password': 'secret', 'confirm_password': 'secret',
+    })
+    assert response.status_code == 201
+
+
+def login(client, email):
+    return client.post('/users/login', json={'email': email, 'password': 'secret'})
+
+
+def register_on_other_worker(email):
+    # Another worker's registration: the row and the version bump are
+    # committed; the bus message announcing them is returned, still in transit.
+    db.session.add(User(username='user', email=email, password=hash_password('secret')))
+    db.session.commit()
+    with db.engine.begin() as conn:
+        version = cache_bus._bump(conn, 'users', 1)
+    return json.dumps({'pid': os.getpid() + 1, 'key': 'users', 'version': version, 'data': [email]})
+
+
+def wait_for_filter():
+    deadline = time.monotonic() + 5
+    while registered_emails._built != registered_emails._dirty:
+        assert time.monotonic() < deadline, 'email filter was not rebuilt'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def filter_ready(app_context):
+    wait_for_filter()
+
+
+def test_unknown_email_skips_the_query(client, filter_ready):
+    register(client, 'known@example.com')
+    assert registered_emails.might_exist('Known@Example.com')
+    assert not registered_emails.might_exist('nobody@example.com')
+    assert login(client, 'nobody@example.com').status_code == 401
+
+
+def test_other_workers_registrations_arrive_with_their_emails(client, filter_ready):
+    cache_bus._receive(register_on_other_worker('elsewhere@example.com'))
+    # Added in place: the filter stays on, with no rebuild.
+    assert registered_emails._built == registered_emails._dirty
+    assert registered_emails.might_exist('elsewhere@example.com')
+    assert login(client, 'elsewhere@example.com').status_code == 200
+
+
+def test_registration_elsewhere_is_not_lost_to_a_later_local_one(client, filter_ready):
+    # The other worker commits first, but this worker commits before the
+    # message arrives. The user registered elsewhere must still log in here.
+    in_transit = register_on_other_worker('first@example.com')
+    register(client, 'second@example.com')
+    cache_bus._receive(in_transit)
+    assert login(client, 'first@example.com').status_code == 200
+    wait_for_filter()
+    assert registered_emails.might_exist('first@example.com')
+    assert login(client, 'first@example.com').status_code == 200
+    assert login(client, 'second@example.com').status_code == 200
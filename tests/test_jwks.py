@@ -0,0 +1,105 @@
+import json
+import pytest
+from services.auth import HmacKey, TokenService, load_asymmetric_key
+
+
+@pytest.fixture
+def crypto():
+    pytest.importorskip('cryptography')
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+    def pem(private_key):
+        return private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                         serialization.NoEncryption()).decode()
+
+    def public_pem(private_key):
+        return private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                     serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+
+    return {
+        'EdDSA': ed25519.Ed25519PrivateKey.generate(),
+        'ES256': ec.generate_private_key(ec.SECP256R1()),
+        'rsa': rsa.generate_private_key(public_exponent=65537, key_size=2048),
+        'secp384r1': ec.generate_private_key(ec.SECP384R1()),
+        'pem': pem,
+        'public_pem': public_pem,
+    }
+
+
+@pytest.mark.parametrize('algorithm', ['EdDSA', 'ES256'])
+def test_asymmetric_tokens_verify_and_resist_tampering(crypto, algorithm):
+    key = load_asymmetric_key('k1', crypto['pem'](crypto[algorithm]))
+    assert key.algorithm == algorithm
+    tokens = TokenService([key], 'k1', 60, 600)
+    access, refresh = tokens.issue(7)
+    assert tokens.verify(access) == 7
+    assert tokens.verify(refresh) == 7
+
+    head, payload, signature = access.split('.')
+    assert tokens.verify(f'{head}.{refresh.split(".")[1]}.{signature}') is None
+    assert tokens.verify(f'{head}.{payload}.{signature[:-4]}AAAA') is None
+    assert tokens.verify(f'{head}.{payload}.') is None
+
+
+def test_keys_load_from_pem_files(crypto, tmp_path):
+    path = tmp_path / 'key.pem'
+    path.write_text(crypto['pem'](crypto['ES256']))
+    key = load_asymmetric_key('k1', str(path))
+    assert key.algorithm == 'ES256'
+    assert key.verify(b'data', key.sign(b'data'))
+
+
+def test_es256_signatures_are_raw_r_s(crypto):
+    key = load_asymmetric_key('k1', crypto['pem'](crypto['ES256']))
+    assert len(key.sign(b'data')) == 64
+
+
+@pytest.mark.parametrize('algorithm', ['EdDSA', 'ES256'])
+def test_tokens_decode_with_pyjwt_and_the_published_key(crypto, algorithm):
+    jwt = pytest.importorskip('jwt')
+    tokens = TokenService([load_asymmetric_key('k1', crypto['pem'](crypto[algorithm]))], 'k1', 60, 600)
+    token = tokens.issue_access(7)
+    jwk = json.loads(tokens.jwks)['keys'][0]
+    public_key = jwt.PyJWK(jwk).key
+    assert jwt.decode(token, public_key, algorithms=[algorithm])['user_id'] == 7
+
+
+def test_retired_public_keys_and_hmac_keys_only_verify(crypto):
+    old = TokenService([load_asymmetric_key('old', crypto['pem'](crypto['EdDSA']))], 'old', 60, 600).issue_access(7)
+    hmac_token = TokenService([HmacKey('default', 'secret')], 'default', 60, 600).issue_access(8)
+
+    keys = [load_asymmetric_key('new', crypto['pem'](crypto['ES256'])),
+            load_asymmetric_key('old', crypto['public_pem'](crypto['EdDSA']), private=False),
+            HmacKey('default', 'secret')]
+    tokens = TokenService(keys, 'new', 60, 600)
+    assert tokens.verify(old) == 7
+    assert tokens.verify(hmac_token) == 8
+    assert [jwk['kid'] for jwk in json.loads(tokens.jwks)['keys']] == ['new', 'old']
+
+    with pytest.raises(ValueError):
+        TokenService(keys, 'old', 60, 600)
+
+
+@pytest.mark.parametrize('name', ['rsa', 'secp384r1'])
+def test_unsupported_key_types_are_refused(crypto, name):
+    with pytest.raises(ValueError):
+        load_asymmetric_key('k1', crypto['pem'](crypto[name]))
+
+
+def test_jwks_is_not_published_for_shared_secrets(client):
+    assert client.get('/.well-known/jwks.json').status_code == 404
+
+
+def test_jwks_endpoint_is_cacheable(app, client, crypto, monkeypatch):
+    tokens = TokenService([load_asymmetric_key('k1', crypto['pem'](crypto['EdDSA']))], 'k1', 60, 600)
+    monkeypatch.setitem(app.extensions, 'token_service', tokens)
+
+    response = client.get('/.well-known/jwks.json')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/jwk-set+json'
+    assert response.get_json()['keys'][0]['kid'] == 'k1'
+    assert 'public' in response.headers['Cache-Control']
+
+    cached = client.get('/.well-known/jwks.json', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
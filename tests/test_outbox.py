@@ -0,0 +1,126 @@
+import itertools
+import json
+import pytest
+from models import db
+from models.order import Order
+from models.outbox import OutboxCheckpoint, OutboxEvent
+from models.product import Product
+from services.outbox import FileSink, add_order_events, relay_batch
+
+consumers = itertools.count()
+
+
+class ListSink:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def deliver(self, events):
+        if self.fail:
+            raise OSError('sink unavailable')
+        self.batches.append([event.id for event in events])
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def consumer(app_context):
+    # A checkpoint of its own, already past every event other tests wrote.
+    name = f'test-{next(consumers)}'
+    while relay_batch(ListSink(), name, 1000):
+        pass
+    return name
+
+
+@pytest.fixture
+def place(app, client, register):
+    client.post('/products/add', json={'name': 'Outbox widget', 'description': 'For events', 'price': 1})
+    with app.app_context():
+        product_id = db.session.query(Product.id).filter_by(name='Outbox widget').first()[0]
+    token = register(f'outbox-{next(consumers)}@example.com')['access_token']
+
+    def place(*quantities):
+        response = client.post('/orders/add', headers={'Authorization': f'Bearer {token}'},
+                               json=[{'product_id': product_id, 'quantity': quantity} for quantity in quantities])
+        assert response.status_code == 201
+
+    return place
+
+
+def test_events_commit_with_their_orders(app_context, consumer, place):
+    place(1, 2)
+    sink = ListSink()
+    assert relay_batch(sink, consumer, 100) == 2
+    events = db.session.query(OutboxEvent).filter(OutboxEvent.id.in_(sink.batches[0])).order_by(OutboxEvent.id).all()
+    assert [json.loads(event.payload)['quantity'] for event in events] == [1, 2]
+    assert sink.batches[0] == sorted(sink.batches[0])
+
+
+def test_rolled_back_orders_leave_no_events(app_context, consumer):
+    order = Order(product_id=1, user_id=1, quantity=1, status='Pending')
+    db.session.add(order)
+    db.session.flush()
+    add_order_events([order])
+    db.session.rollback()
+    db.session.commit()
+    assert relay_batch(ListSink(), consumer, 100) == 0
+
+
+def test_checkpoint_advances_batch_by_batch(app_context, consumer, place):
+    place(1, 1, 1)
+    sink = ListSink()
+    assert relay_batch(sink, consumer, 2) == 2
+    assert relay_batch(sink, consumer, 2) == 1
+    assert relay_batch(sink, consumer, 2) == 0
+    assert db.session.get(OutboxCheckpoint, consumer).last_event_id == sink.batches[-1][-1]
+
+
+def test_failed_delivery_is_retried(app_context, consumer, place):
+    place(1)
+    before = db.session.get(OutboxCheckpoint, consumer).last_event_id
+    with pytest.raises(OSError):
+        relay_batch(ListSink(fail=True), consumer, 100)
+    assert db.session.get(OutboxCheckpoint, consumer).last_event_id == before
+
+    sink = ListSink()
+    assert relay_batch(sink, consumer, 100) == 1
+    assert sink.batches[0][0] > before
+
+
+def test_consumers_have_their_own_checkpoints(app_context, consumer, place):
+    other = f'{consumer}-other'
+    while relay_batch(ListSink(), other, 1000):
+        pass
+    place(1)
+    first, second = ListSink(), ListSink()
+    assert relay_batch(first, consumer, 100) == 1
+    assert relay_batch(second, other, 100) == 1
+    assert first.batches == second.batches
+
+
+def test_file_sink_appends_json_lines(app_context, consumer, place, tmp_path):
+    place(3)
+    path = tmp_path / 'events.jsonl'
+    relay_batch(FileSink(str(path)), consumer, 100)
+    [line] = path.read_text().splitlines()
+    event = json.loads(line)
+    assert event['event_type'] == 'order.created'
+    assert event['payload']['quantity'] == 3
+
+
+def test_prune_keeps_events_a_consumer_still_needs(app, app_context, consumer, place):
+    db.session.query(OutboxCheckpoint).filter(OutboxCheckpoint.consumer != consumer).delete()
+    db.session.commit()
+    behind = f'{consumer}-behind'
+    db.session.add(OutboxCheckpoint(consumer=behind, last_event_id=db.session.get(OutboxCheckpoint, consumer).last_event_id))
+    db.session.commit()
+
+    place(1, 1)
+    relay_batch(ListSink(), consumer, 100)
+    result = app.test_cli_runner().invoke(args=['outbox', 'prune'])
+    assert result.exit_code == 0
+
+    sink = ListSink()
+    assert relay_batch(sink, behind, 100) == 2
+    assert db.session.query(OutboxEvent).filter(OutboxEvent.id < sink.batches[0][0]).count() == 0
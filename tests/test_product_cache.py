@@ -0,0 +1,49 @@
+import pytest
+from services.product_cache import ProductCache, parse_ids
+
+
+def entry(product_id, name='Widget'):
+    return {'id': product_id, 'name': name}
+
+
+@pytest.fixture
+def cache():
+    cache = ProductCache()
+    cache.size = 3
+    return cache
+
+
+def test_lookup_splits_hits_and_misses(cache):
+    cache.store([entry(1), entry(2)], cache.generation)
+    found, missing = cache.lookup([2, 3, 1])
+    assert sorted(found) == [1, 2]
+    assert missing == [3]
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    cache.store([entry(1), entry(2), entry(3)], cache.generation)
+    cache.lookup([1])
+    cache.store([entry(4)], cache.generation)
+    found, missing = cache.lookup([1, 2, 3, 4])
+    assert missing == [2]
+
+
+def test_rows_loaded_before_a_clear_are_not_stored(cache):
+    generation = cache.generation
+    cache.clear('products')
+    cache.store([entry(1, 'old name')], generation)
+    assert cache.lookup([1]) == ({}, [1])
+
+
+def test_rows_loaded_before_an_evict_are_not_stored(cache):
+    generation = cache.generation
+    cache.evict('product:1')
+    cache.store([entry(1, 'old name')], generation)
+    assert cache.lookup([1]) == ({}, [1])
+
+
+def test_parse_ids():
+    assert parse_ids('3, 1,3', 10) == [3, 1]
+    for raw in ('', 'a,b', '1,2,3'):
+        with pytest.raises(ValueError):
+            parse_ids(raw, 2)
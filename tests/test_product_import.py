@@ -0,0 +1,82 @@
+import json
+import pytest
+from models import db
+from models.product import Product
+
+
+@pytest.fixture(scope='module')
+def admin(app):
+    app.config['ADMIN_EMAILS'] = app.config['ADMIN_EMAILS'] + ['importer@example.com']
+    response = app.test_client().post('/users/register', json={
+        'username': 'importer', 'email': 'importer@example.com', 'password': 'secret', 'confirm_password': 'secret',
+    })
+    yield {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    app.config['ADMIN_EMAILS'] = [e for e in app.config['ADMIN_EMAILS'] if e != 'importer@example.com']
+
+
+def ndjson(*rows):
+    return ''.join((row if isinstance(row, str) else json.dumps(row)) + '\n' for row in rows).encode()
+
+
+def post(client, admin, body, mimetype='application/x-ndjson'):
+    return client.post('/products/import', headers=admin, data=body, content_type=mimetype)
+
+
+def product(sku):
+    return db.session.query(Product.name, Product.price).filter_by(sku=sku).one_or_none()
+
+
+def test_rows_are_inserted_then_updated(app_context, client, admin):
+    report = post(client, admin, ndjson(
+        {'sku': 'IMP-1', 'name': 'Teapot', 'description': 'Glass teapot', 'price': 10},
+        {'sku': 'IMP-2', 'name': 'Lid', 'description': 'Teapot lid', 'price': '4.5'},
+    )).get_json()
+    assert (report['inserted'], report['updated'], report['failed']) == (2, 0, 0)
+
+    report = post(client, admin, b'sku,name,description,price\nIMP-1,Teapot,Glass teapot,12\n', 'text/csv').get_json()
+    assert (report['inserted'], report['updated']) == (0, 1)
+    assert product('IMP-1') == ('Teapot', 12)
+
+
+def test_invalid_rows_are_reported(client, admin):
+    report = post(client, admin, ndjson(
+        {'sku': 'IMP-3', 'name': 'Bulb', 'description': '', 'price': -1},
+        'not json',
+        {'sku': 'IMP-4', 'name': 'Bulb', 'description': '', 'price': 1},
+    )).get_json()
+    assert (report['inserted'], report['failed']) == (1, 2)
+    assert [error['row'] for error in report['errors']] == [1, 2]
+
+
+def test_duplicate_skus_are_reported_not_overwritten(app, app_context, client, admin, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMPORT_BATCH_SIZE', 2)
+    report = post(client, admin, ndjson(
+        {'sku': 'IMP-DUP', 'name': 'First', 'description': '', 'price': 1},
+        {'sku': 'IMP-DUP', 'name': 'Second', 'description': '', 'price': 2},
+        {'sku': 'IMP-5', 'name': 'Other', 'description': '', 'price': 3},
+        {'sku': 'IMP-DUP', 'name': 'Third', 'description': '', 'price': 4},
+    )).get_json()
+    assert (report['rows'], report['inserted'], report['failed']) == (4, 2, 2)
+    assert [(error['row'], error['sku']) for error in report['errors']] == [(2, 'IMP-DUP'), (4, 'IMP-DUP')]
+    assert 'row 1' in report['errors'][0]['error']
+    assert product('IMP-DUP') == ('First', 1)
+
+
+def test_unreadable_body_keeps_the_committed_rows(app, app_context, client, admin, monkeypatch):
+    # The body is decoded in chunks, so the bad bytes must come well after
+    # the first rows for those to be read at all.
+    monkeypatch.setitem(app.config, 'IMPORT_BATCH_SIZE', 50)
+    rows = [{'sku': f'IMP-STREAM-{i}', 'name': 'Streamed', 'description': 'x' * 40, 'price': 1} for i in range(500)]
+    response = post(client, admin, ndjson(*rows) + b'\xff\xfe\n')
+    assert response.status_code == 400
+    report = response.get_json()
+    assert 'decode' in report['error']
+    assert 0 < report['committed'] == report['inserted'] == report['rows'] <= 500
+    assert db.session.query(Product).filter(Product.sku.like('IMP-STREAM-%')).count() == report['committed']
+
+
+def test_csv_without_the_required_columns(client, admin):
+    response = post(client, admin, b'sku,name\nIMP-7,Teapot\n', 'text/csv')
+    assert response.status_code == 400
+    assert response.get_json()['committed'] == 0
+    assert 'missing columns' in response.get_json()['message']
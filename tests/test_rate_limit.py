@@ -0,0 +1,84 @@
+import sys
+import threading
+import pytest
+from services.rate_limit import MemoryStore, SharedMemoryStore, gcra
+
+
+def test_gcra_allows_a_burst_then_spaces_requests():
+    tat = None
+    for _ in range(5):
+        tat, retry_after = gcra(tat, 100.0, 5, 60)
+        assert retry_after == 0
+    rejected, retry_after = gcra(tat, 100.0, 5, 60)
+    assert rejected is None
+    assert retry_after == pytest.approx(12.0)
+    # One interval later, one more request fits.
+    assert gcra(tat, 112.0, 5, 60)[1] == 0
+
+
+def test_gcra_forgets_idle_keys():
+    tat = None
+    for _ in range(5):
+        tat, _ = gcra(tat, 100.0, 5, 60)
+    assert gcra(tat, 160.0, 5, 60) == (172.0, 0)
+
+
+@pytest.fixture(params=['memory', 'shared'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryStore()
+    pytest.importorskip('fcntl')
+    return SharedMemoryStore(str(tmp_path / 'rate-limit'), 64)
+
+
+def test_store_limits_each_key_separately(store):
+    assert [store.hit('login:ip:1', 3, 60) for _ in range(3)] == [0, 0, 0]
+    assert 0 < store.hit('login:ip:1', 3, 60) <= 20
+    assert store.hit('login:ip:2', 3, 60) == 0
+
+
+def test_shared_store_is_seen_by_every_opener(tmp_path):
+    pytest.importorskip('fcntl')
+    path = str(tmp_path / 'rate-limit')
+    first, second = SharedMemoryStore(path, 64), SharedMemoryStore(path, 64)
+    assert first.hit('login:email:a@example.com', 2, 60) == 0
+    assert second.hit('login:email:a@example.com', 2, 60) == 0
+    assert first.hit('login:email:a@example.com', 2, 60) > 0
+
+
+@pytest.fixture
+def busy_switching():
+    # Thread switches every microsecond, so races show up within a test.
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_threads_share_one_allowance(store, busy_switching):
+    # Threads of one worker share the store's descriptor; the limit still holds.
+    start = threading.Barrier(8)
+    allowed = []
+
+    def hammer():
+        start.wait()
+        allowed.append(sum(1 for _ in range(2500) if store.hit('login:ip:threads', 10000, 10 ** 6) == 0))
+
+    threads = [threading.Thread(target=hammer, daemon=True) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+        assert not thread.is_alive()
+    assert sum(allowed) == 10000
+
+
+def test_memory_store_prunes_expired_keys(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('services.rate_limit.time.time', lambda: now[0])
+    store = MemoryStore(max_keys=2)
+    store.hit('a', 1, 1)
+    store.hit('b', 1, 1)
+    now[0] = 105.0
+    store.hit('c', 1, 1)
+    assert set(store._tats) == {'c'}
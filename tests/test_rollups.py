@@ -0,0 +1,108 @@
+import itertools
+import pytest
+from models import db
+from models.order import Order
+from models.order_rollup import OrderDailyRollup, RollupWatermark
+from models.order_summary import UserOrderSummary
+from models.product import Product
+from services.rollups import WATERMARK, backfill_user_summaries, compact, init_rollups, rebuild
+
+names = itertools.count()
+
+
+@pytest.fixture
+def shop(app, client, register):
+    # A product of its own (so other tests' orders do not show up in its
+    # rollups) and a customer to order it.
+    name = f'Rollup product {next(names)}'
+    client.post('/products/add', json={'name': name, 'description': 'For rollups', 'price': 3})
+    with app.app_context():
+        product_id = db.session.query(Product.id).filter_by(name=name).scalar()
+    token = register(f'{name.replace(" ", "-").lower()}@example.com')['access_token']
+
+    def order(quantity):
+        response = client.post('/orders/add', headers={'Authorization': f'Bearer {token}'},
+                               json=[{'product_id': product_id, 'quantity': quantity}])
+        assert response.status_code == 201
+
+    def totals():
+        with app.app_context():
+            row = (db.session.query(db.func.sum(OrderDailyRollup.order_count), db.func.sum(OrderDailyRollup.revenue))
+                   .filter(OrderDailyRollup.product_id == product_id).one())
+        return tuple(value or 0 for value in row)
+
+    return order, totals
+
+
+@pytest.fixture
+def deferred(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'ROLLUP_MODE', 'deferred')
+
+
+def test_inline_mode_counts_orders_as_they_are_placed(app_context, shop):
+    order, totals = shop
+    order(2)
+    assert totals() == (1, 6)
+    with pytest.raises(RuntimeError):
+        compact(100, 0)
+    assert totals() == (1, 6)
+
+
+def test_deferred_mode_needs_a_rebuild_before_compacting(app_context, shop, deferred):
+    order, totals = shop
+    order(2)
+    assert totals() == (0, 0)
+    with pytest.raises(RuntimeError):
+        compact(100, 0)
+
+    rebuild()
+    assert totals() == (1, 6)
+    order(1)
+    assert totals() == (1, 6)
+    assert compact(100, 0) >= 1
+    assert totals() == (2, 9)
+    assert compact(100, 0) == 0
+    assert totals() == (2, 9)
+
+
+def test_switching_back_to_inline_discards_the_watermark(app, app_context, shop, deferred):
+    order, totals = shop
+    rebuild()
+    assert db.session.get(RollupWatermark, WATERMARK) is not None
+
+    app.config['ROLLUP_MODE'] = 'inline'
+    init_rollups(app)
+    assert db.session.get(RollupWatermark, WATERMARK) is None
+    order(1)
+    rebuild()
+    assert db.session.get(RollupWatermark, WATERMARK) is None
+    assert totals() == (1, 3)
+
+    app.config['ROLLUP_MODE'] = 'deferred'
+    with pytest.raises(RuntimeError):
+        compact(100, 0)
+    assert totals() == (1, 3)
+
+
+def test_rebuild_matches_inline_counts(app_context, shop):
+    order, totals = shop
+    order(1)
+    order(4)
+    counted = totals()
+    rebuild()
+    assert totals() == counted == (2, 15)
+
+
+def test_user_summaries_are_backfilled_once(app_context, shop):
+    order, _ = shop
+    order(2)
+    order(5)
+    # A database from before the summary table: the orders exist, no summaries.
+    db.session.query(UserOrderSummary).delete()
+    db.session.commit()
+
+    assert backfill_user_summaries()
+    assert not backfill_user_summaries()
+    summaries = {row.user_id: row.order_count for row in db.session.query(UserOrderSummary)}
+    orders = dict(db.session.query(Order.user_id, db.func.count(Order.id)).group_by(Order.user_id).all())
+    assert summaries == orders
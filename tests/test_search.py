@@ -0,0 +1,58 @@
+import struct
+import pytest
+from models import db
+from models.product import Product
+from services.search import decode_cursor, encode_cursor, search_products
+
+COLUMNS = [Product.id, Product.name]
+
+
+@pytest.fixture(scope='module')
+def lamps(app):
+    # Identical text ranks identically, so pages end inside runs of ties.
+    with app.app_context():
+        products = [Product(name='Brass lamp', description='Reading lamp', price=10) for _ in range(5)]
+        products += [Product(name='Lamp', description='Lamp lamp lamp', price=10) for _ in range(3)]
+        db.session.add_all(products)
+        db.session.commit()
+        return sorted(product.id for product in products)
+
+
+def walk(q, limit):
+    ids, cursor = [], None
+    while True:
+        rows, cursor = search_products(q, COLUMNS, limit, cursor)
+        ids += [row.id for row in rows]
+        if not cursor:
+            return ids
+
+
+def test_cursor_round_trips_a_widened_real_exactly():
+    # ts_rank returns real; widened to double it must survive the cursor.
+    rank = struct.unpack('<f', struct.pack('<f', 0.0607927))[0]
+    assert decode_cursor(encode_cursor(rank, 7)) == (rank, 7)
+
+
+def test_malformed_cursor_is_a_value_error():
+    with pytest.raises(ValueError):
+        decode_cursor('not a cursor')
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 8])
+def test_pages_return_every_match_once(app_context, lamps, limit):
+    ids = walk('lamp', limit)
+    assert sorted(ids) == lamps
+    assert len(ids) == len(lamps)
+
+
+def test_search_endpoint_pages(client, lamps):
+    ids, cursor = [], None
+    while True:
+        page = client.get('/products/search', query_string={
+            'q': 'lamp', 'limit': 3, **({'cursor': cursor} if cursor else {}),
+        }).get_json()
+        ids += [product['id'] for product in page['results']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert sorted(ids) == lamps
@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+import pytest
+from models import db
+from models.product import Product
+from services import suggest
+from services.suggest import SuggestIndex, load_suggest_index, suggest_index
+
+
+def test_prefix_lookups_rank_by_popularity():
+    index = SuggestIndex()
+    index.build([(1, 'Kettle', 5), (2, 'Kettlebell', 9), (3, 'Kite', 1), (4, 'Café', 0)], 10, 2)
+    assert [s['id'] for s in index.suggest('k', 10)] == [2, 1, 3]
+    assert [s['id'] for s in index.suggest('kett', 10)] == [2, 1]
+    assert [s['id'] for s in index.suggest('CAFE', 10)] == [4]
+    index.bump(1, 10)
+    assert [s['id'] for s in index.suggest('ke', 1)] == [1]
+    assert len(index.suggest('k', 0)) == 1
+
+
+def test_popularity_is_loaded_from_the_rollups(app, app_context, client, register):
+    for name in ('Zither basic', 'Zither deluxe'):
+        client.post('/products/add', json={'name': name, 'description': 'Strings', 'price': 1})
+    deluxe = db.session.query(Product.id).filter_by(name='Zither deluxe').scalar()
+    token = register('zither@example.com')['access_token']
+    client.post('/orders/add', headers={'Authorization': f'Bearer {token}'},
+                json=[{'product_id': deluxe, 'quantity': 3}])
+
+    load_suggest_index(app)
+    assert [s['name'] for s in suggest_index.suggest('zith', 2)] == ['Zither deluxe', 'Zither basic']
+
+
+def test_one_builder_per_process(app, monkeypatch):
+    started = []
+
+    class Builder:
+        def __init__(self, **kwargs):
+            pass
+
+        def start(self):
+            started.append(self)
+
+    index = SuggestIndex()
+    index._app = app
+    barrier = threading.Barrier(8)
+
+    def call():
+        barrier.wait()
+        index._ensure_builder()
+
+    def slow_getpid(getpid=os.getpid):
+        # Widens the gap between checking for a builder and claiming it.
+        time.sleep(0.01)
+        return getpid()
+
+    callers = [threading.Thread(target=call) for _ in range(8)]
+    # suggest.threading is this module too: patch only after the callers exist.
+    monkeypatch.setattr(suggest.threading, 'Thread', Builder)
+    monkeypatch.setattr(suggest.os, 'getpid', slow_getpid)
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+    assert len(started) == 1
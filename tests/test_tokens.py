@@ -0,0 +1,109 @@
+import base64
+import json
+import time
+import pytest
+from services.auth import HmacKey, TokenService, _b64encode, _json_segment
+
+
+def service(*kids, active=None, legacy_kid='default', access_ttl=900, refresh_ttl=3600):
+    keys = [HmacKey(kid, f'secret-{kid}') for kid in kids]
+    return TokenService(keys, active or kids[0], access_ttl, refresh_ttl, legacy_kid=legacy_kid)
+
+
+def segment(token, index):
+    data = token.split('.')[index]
+    return json.loads(base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)))
+
+
+def header(token):
+    return segment(token, 0)
+
+
+def claims(token):
+    return segment(token, 1)
+
+
+def test_issued_tokens_verify():
+    tokens = service('default')
+    access, refresh = tokens.issue(7)
+    assert tokens.verify(access) == 7
+    assert tokens.verify(refresh) == 7
+    assert tokens.verify(tokens.issue_access(8)) == 8
+    assert tokens.verify(tokens.issue_refresh(9)) == 9
+
+
+def test_claims_and_header():
+    tokens = service('k1', access_ttl=60, refresh_ttl=600)
+    before = int(time.time())
+    access, refresh = tokens.issue(7)
+    assert header(access) == {'alg': 'HS256', 'typ': 'JWT', 'kid': 'k1'}
+    assert claims(access)['user_id'] == 7
+    assert before + 60 <= claims(access)['exp'] <= int(time.time()) + 60
+    assert claims(refresh)['exp'] - claims(access)['exp'] == 540
+
+
+def test_expired_token_is_rejected():
+    tokens = service('default', access_ttl=-1)
+    assert tokens.verify(tokens.issue_access(7)) is None
+
+
+def test_token_without_numeric_exp_is_rejected():
+    tokens = service('default')
+    assert tokens.verify(tokens.sign({'user_id': 7})) is None
+    assert tokens.verify(tokens.sign({'user_id': 7, 'exp': str(int(time.time()) + 60)})) is None
+
+
+def test_tampered_tokens_are_rejected():
+    tokens = service('default')
+    token = tokens.issue_access(7)
+    head, payload, signature = token.split('.')
+    forged_payload = _json_segment({'user_id': 1, 'exp': int(time.time()) + 60})
+    assert tokens.verify(f'{head}.{forged_payload}.{signature}') is None
+    assert tokens.verify(f'{head}.{payload}.{_b64encode(b"x" * 32)}') is None
+    # A header the service did not issue is never parsed, let alone trusted.
+    for forged_header in ({'alg': 'none', 'typ': 'JWT', 'kid': 'default'},
+                          {'alg': 'HS256', 'typ': 'JWT', 'kid': 'unknown'}):
+        assert tokens.verify(f'{_json_segment(forged_header)}.{payload}.{signature}') is None
+        assert tokens.verify(f'{_json_segment(forged_header)}.{payload}.') is None
+
+
+def test_token_signed_with_another_secret_is_rejected():
+    assert service('default').verify(TokenService([HmacKey('default', 'other')], 'default', 60, 60).issue_access(7)) is None
+
+
+@pytest.mark.parametrize('token', ['', 'abc', 'a.b', 'a.b.c', 'a.b.c.d', 'é.é.é', '...', None])
+def test_malformed_tokens_are_rejected(token):
+    assert service('default').verify(token) is None
+
+
+def test_rotation_keeps_old_tokens_valid_until_the_kid_is_dropped():
+    before = service('k1', 'k2', active='k1')
+    old = before.issue_access(7)
+
+    rotated = service('k1', 'k2', active='k2')
+    new = rotated.issue_access(7)
+    assert header(new)['kid'] == 'k2'
+    assert rotated.verify(old) == 7
+    assert rotated.verify(new) == 7
+
+    retired = service('k2')
+    assert retired.verify(old) is None
+    assert retired.verify(new) == 7
+
+
+def test_legacy_pyjwt_tokens_verify_against_the_default_key():
+    jwt = pytest.importorskip('jwt')
+    legacy = jwt.encode({'user_id': 7, 'exp': int(time.time()) + 60}, 'secret-default', algorithm='HS256')
+    assert service('default').verify(legacy) == 7
+    assert service('default', legacy_kid=None).verify(legacy) is None
+    assert service('other').verify(legacy) is None
+
+
+def test_tokens_decode_with_pyjwt():
+    jwt = pytest.importorskip('jwt')
+    token = service('k1').issue_access(7)
+    assert jwt.decode(token, 'secret-k1', algorithms=['HS256'])['user_id'] == 7
+
+
+def test_hmac_keyring_publishes_no_jwks():
+    assert service('default').jwks is None
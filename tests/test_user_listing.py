@@ -0,0 +1,86 @@
+import base64
+import json
+from datetime import datetime, timedelta
+import pytest
+from models import db
+from models.user import User
+from services.user_listing import decode_cursor, encode_cursor, iter_user_pages, list_users
+
+T0 = datetime(2024, 1, 1, 12, 0, 0)
+COLUMNS = [User.id, User.email]
+
+
+@pytest.fixture(scope='module')
+def listed(app):
+    # Users sharing timestamps, so that pages end inside runs of ties.
+    created = [T0, T0, T0, T0 + timedelta(seconds=1), T0 + timedelta(seconds=1), T0 + timedelta(seconds=2), T0]
+    with app.app_context():
+        users = [User(username='user', email=f'Listing-{i}@example.com', password='x', date_created=when)
+                 for i, when in enumerate(created)]
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.id for user in sorted(users, key=lambda user: (user.date_created, user.id))]
+
+
+def walk(limit, **filters):
+    ids, cursor = [], None
+    while True:
+        rows, cursor = list_users(COLUMNS, limit, cursor, email_prefix='listing-', **filters)
+        ids += [row.id for row in rows]
+        if not cursor:
+            return ids
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(T0, 42)) == (T0, 42)
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    base64.urlsafe_b64encode(b'not json').decode(),
+    base64.urlsafe_b64encode(json.dumps([T0.isoformat()]).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps(['yesterday', 1]).encode()).decode(),
+])
+def test_malformed_cursor_is_a_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 7, 10])
+def test_pages_return_every_user_once_in_order(app_context, listed, limit):
+    assert walk(limit) == listed
+
+
+def test_filters(app_context, listed):
+    assert walk(2, created_after=T0 + timedelta(seconds=1)) == listed[-3:]
+    assert walk(2, created_before=T0 + timedelta(seconds=1)) == listed[:4]
+    rows, _ = list_users(COLUMNS, 10, email_prefix='LISTING-3')
+    assert [row.email for row in rows] == ['Listing-3@example.com']
+
+
+def test_iter_user_pages(app_context, listed):
+    pages = list(iter_user_pages(COLUMNS, 3, email_prefix='listing-'))
+    assert [len(rows) for rows in pages] == [3, 3, 1]
+    assert [row.id for rows in pages for row in rows] == listed
+
+
+def test_admin_listing_pages_without_password_hashes(app, client, register, listed, monkeypatch):
+    monkeypatch.setitem(app.config, 'ADMIN_EMAILS', ['admin-for-listing@example.com'])
+    token = register('admin-for-listing@example.com')['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    ids, cursor = [], None
+    while True:
+        response = client.get('/users/', headers=headers, query_string={
+            'email_prefix': 'listing-', 'limit': 3, **({'cursor': cursor} if cursor else {}),
+        })
+        assert response.status_code == 200
+        page = response.get_json()
+        assert all('password' not in user for user in page['results'])
+        ids += [user['id'] for user in page['results']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert ids == listed
+
+    assert client.get('/users/', headers=headers, query_string={'cursor': 'garbage'}).status_code == 400
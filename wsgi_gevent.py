@@ -0,0 +1,22 @@
+# Cooperative (gevent) deployment profile for the I/O-bound order endpoints.
+#
+#   gunicorn -k gevent --worker-connections 5000 -w 2 -b :8003 wsgi_gevent:app
+#
+# Monkey-patching must happen before anything imports socket, threading or
+# psycopg2, which is why this module patches first and imports the app last.
+# Size SQLALCHEMY_ENGINE_OPTIONS['pool_size'] for the number of greenlets that
+# may hold a connection at once; requests beyond it queue on the pool.
+#
+# Load test with thousands of keep-alive clients (raise `ulimit -n` first):
+#
+#   python benchmarks/load.py --concurrency 5000 --path /orders/ \
+#       --header "Authorization: Bearer <token>" --target gevent=http://127.0.0.1:8003
+from gevent import monkey
+
+monkey.patch_all()
+
+from services.cooperative import init_cooperative
+
+init_cooperative()
+
+from app import app  # noqa: E402